@@ -1,15 +1,27 @@
 '''
 Use this script to filter the rgb and depth image
+深度截断、水平翻转（原来的 flip.py）和裁剪一次做完，见 scripts/utils/image_utils.py。
+采集时可以直接在录制进程里做：CameraManager.record(..., preprocess=DepthMaskFilter(...))
 '''
 import os
+import sys
 import cv2
-import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
 
-def process_images(depth_dir, rgb_dir, output_dir):
+from utils.image_utils import DepthMaskFilter
+
+def process_images(depth_dir, rgb_dir, output_dir, max_depth=5.5, flip=False, crop=None):
+    '''
+    :param max_depth: 大于这个深度（米）或者没有深度的像素涂黑
+    :param flip: True 时同时水平翻转，不用再跑 flip.py
+    :param crop: (x, y, w, h)，在原图坐标里裁剪
+    '''
     # Create output directory if it doesn't exist
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
+
+    depth_filter = DepthMaskFilter(max_depth=max_depth, flip=flip, crop=crop)
+
     # Iterate through all files in the depth image directory
     for depth_filename in os.listdir(depth_dir):
         if depth_filename.endswith('.png'):
@@ -25,25 +37,11 @@ def process_images(depth_dir, rgb_dir, output_dir):
                 print(f"Skipping pair: {depth_image_path}, {rgb_image_path}")
                 continue
 
-            # Convert depth values to meters (assuming depth values are in millimeters)
-            depth_image_meters = depth_image / 1000.0
-
-            # Handle zero depth values by setting them to a large value
-            depth_image_meters[depth_image_meters == 0] = 100
-
-            # Create a mask where depth values are greater than 5 meters
-            mask = depth_image_meters > 5.5
-
-            # Set pixel values in RGB image to 0 where mask is True
-            rgb_image[mask] = [0, 0, 0]
-            
-            # rgb_image_rotated = cv2.rotate(rgb_image, cv2.ROTATE_90_CLOCKWISE)
-            # # rgb_image_rotated = cv2.rotate(rgb_image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+            # 直接在 z16 整数上比较（depth 单位是毫米），不转成米
+            rgb_image = depth_filter(rgb_image, depth_image)
 
-            
             # Save the modified RGB image
             output_image_path = os.path.join(output_dir, os.path.basename(rgb_image_path))
-            # cv2.imwrite(output_image_path, rgb_image_rotated)
             cv2.imwrite(output_image_path, rgb_image)
             print(f"Processed and saved: {output_image_path}")
 
@@ -52,6 +50,7 @@ depth_image_dir = '/Volumes/LaCie/Agrosense2/data_2025_7_22/data/250122075706/20
 rgb_image_dir = '/Volumes/LaCie/Agrosense2/data_2025_7_22/data/250122075706/20250714_2046/rgb'
 output_image_dir = '/Volumes/LaCie/Agrosense2/data_2025_7_22/data/250122075706/20250714_2046/filtered55'
 
-# Process images
-process_images(depth_image_dir, rgb_image_dir, output_image_dir)
+if __name__ == "__main__":
+    # Process images
+    process_images(depth_image_dir, rgb_image_dir, output_image_dir)
 
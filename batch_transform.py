@@ -0,0 +1,257 @@
+'''
+批量图像变换，代替 flip.py、experiments/cropimg.py、experiments/roatation.py 和 RGB_filter.py 一个文件夹一个文件夹地串行处理：
+  操作链写成一串，按顺序对每张图做：
+      flip                    水平翻转（flip.py）
+      flip=v                  垂直翻转
+      rotate180               旋转 180 度（experiments/roatation.py）
+      crop-quadrant=leftdown  裁出四分之一（experiments/cropimg.py 是 leftdown），还有 leftup / rightup / rightdown
+      depth-mask=5.5          没有深度或者深度大于 5.5 米的像素涂黑（RGB_filter.py），需要 --depth
+  depth 图跟着做同样的翻转 / 旋转 / 裁剪，depth-mask 放在链的哪一步都和 RGB 逐像素对应。
+
+  文件分成几块交给进程池，每个进程里有几个线程提前读下面几张图（cv2 读写 PNG 时不占 GIL）。
+  输出已经是最新的就跳过：
+      --skip mtime  输出比输入（和 depth）新，并且是用现在的操作链做出来的
+      --skip hash   输入文件内容的 hash 和上次一样，并且是用现在的操作链做出来的（文件被拷贝过、mtime 不可靠时用）
+  操作链和用它做完的每个文件（和输入的 hash）记在输出文件夹的 .batch_transform.json 里，
+  操作链变了就先清空文件列表再开始写，中途停下来时不会把旧操作链的输出当成新的。
+
+    python batch_transform.py data/250122075706/20250714_2046/rgb data/250122075706/20250714_2046/flipped_filtered55 \
+        --ops depth-mask=5.5,flip --depth data/250122075706/20250714_2046/depth
+'''
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import cv2
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+
+from utils.image_utils import DepthMaskFilter
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+MANIFEST = ".batch_transform.json"
+QUADRANTS = ("leftup", "leftdown", "rightup", "rightdown")
+
+
+def parse_ops(spec):
+    """
+    "depth-mask=5.5,flip" -> [("depth-mask", 5.5), ("flip", "h")]，参数不对时直接报错，不等到进程池里才发现
+    """
+    ops = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, arg = item.partition("=")
+        if name == "flip":
+            if arg not in ("", "h", "v"):
+                raise ValueError(f"flip takes h or v, got {arg!r}")
+            ops.append(("flip", arg or "h"))
+        elif name == "rotate180":
+            ops.append(("rotate180", None))
+        elif name == "crop-quadrant":
+            if arg not in QUADRANTS:
+                raise ValueError(f"crop-quadrant takes one of {QUADRANTS}, got {arg!r}")
+            ops.append(("crop-quadrant", arg))
+        elif name == "depth-mask":
+            ops.append(("depth-mask", float(arg) if arg else 5.5))
+        else:
+            raise ValueError(f"unknown operation: {name}")
+    return ops
+
+
+def apply_ops(ops, image, depth=None):
+    """按顺序做 ops，depth 跟着做同样的几何变换。返回 (image, depth)"""
+    for name, arg in ops:
+        if name == "flip":
+            code = 1 if arg == "h" else 0
+            image = cv2.flip(image, code)
+            depth = None if depth is None else cv2.flip(depth, code)
+        elif name == "rotate180":
+            image = cv2.rotate(image, cv2.ROTATE_180)
+            depth = None if depth is None else cv2.rotate(depth, cv2.ROTATE_180)
+        elif name == "crop-quadrant":
+            image = _quadrant(image, arg)
+            depth = None if depth is None else _quadrant(depth, arg)
+        elif name == "depth-mask":
+            if depth is None:
+                raise ValueError("depth-mask needs a depth image (--depth)")
+            image = DepthMaskFilter(max_depth=arg, flip=False)(image, depth)
+    return image, depth
+
+
+def _quadrant(image, quadrant):
+    h, w = image.shape[:2]
+    rows = slice(0, h // 2) if quadrant.endswith("up") else slice(h // 2, h)
+    cols = slice(0, w // 2) if quadrant.startswith("left") else slice(w // 2, w)
+    return image[rows, cols]
+
+
+def depth_path_for(depth_dir, filename):
+    """depth 和 RGB 同名（CameraManager 的 PNG），或者是 <名字>_depth.png（RGB_filter.py 的约定）"""
+    path = os.path.join(depth_dir, filename)
+    if os.path.exists(path):
+        return path
+    stem, ext = os.path.splitext(filename)
+    return os.path.join(depth_dir, f"{stem}_depth{ext}")
+
+
+def file_hash(*paths):
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def _read(job):
+    _, image_path, depth_path, _ = job
+    depth = None if depth_path is None else cv2.imread(depth_path, cv2.IMREAD_UNCHANGED)
+    return cv2.imread(image_path, cv2.IMREAD_UNCHANGED), depth
+
+
+def _process_chunk(jobs, ops, output_dir, skip, png_compression, prefetch):
+    """
+    worker 进程：处理一块文件，返回 [(文件名, 状态, hash)]，状态是 "done" / "skipped" / "failed: ..."
+    job = (文件名, 输入路径, depth 路径, 上次的 hash)
+    """
+    results = []
+    params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    with ThreadPoolExecutor(max_workers=prefetch + 1) as pool:
+        if skip == "hash":
+            hashes = list(pool.map(lambda job: file_hash(*filter(None, job[1:3])), jobs))
+            todo = []
+            for job, digest in zip(jobs, hashes):
+                if digest == job[3] and os.path.exists(os.path.join(output_dir, job[0])):
+                    results.append((job[0], "skipped", digest))
+                else:
+                    todo.append((job, digest))
+        else:
+            todo = [(job, None) for job in jobs]
+
+        # 读最多领先 prefetch 张；写也交给线程，主循环只做变换
+        reads = [pool.submit(_read, job) for job, _ in todo[:prefetch]]
+        writes = []
+        for k, (job, digest) in enumerate(todo):
+            if k + prefetch < len(todo):
+                reads.append(pool.submit(_read, todo[k + prefetch][0]))
+            filename = job[0]
+            try:
+                image, depth = reads[k].result()
+                reads[k] = None
+                if image is None or (job[2] is not None and depth is None):
+                    raise FileNotFoundError(f"cannot read {job[1]}" + ("" if job[2] is None else f" / {job[2]}"))
+                image, _ = apply_ops(ops, image, depth)
+                writes.append((filename, digest, pool.submit(
+                    cv2.imwrite, os.path.join(output_dir, filename), image,
+                    params if filename.lower().endswith(".png") else [])))
+            except Exception as e:
+                results.append((filename, f"failed: {e}", None))
+        for filename, digest, future in writes:
+            ok = future.result()
+            results.append((filename, "done" if ok else "failed: imwrite", digest))
+    return results
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def batch_transform(input_dir, output_dir, ops, depth_dir=None, workers=None, skip="mtime",
+                    png_compression=1, prefetch=4, chunk_size=64):
+    """
+    :param ops: parse_ops() 的结果或者操作链字符串
+    :param skip: "mtime" / "hash" / None
+    :return: {"done": n, "skipped": n, "failed": n, "seconds": s}
+    """
+    if isinstance(ops, str):
+        ops = parse_ops(ops)
+    if any(name == "depth-mask" for name, _ in ops) and depth_dir is None:
+        raise ValueError("depth-mask needs depth_dir")
+    os.makedirs(output_dir, exist_ok=True)
+
+    chain = {"ops": [[name, arg] for name, arg in ops], "depth_dir": depth_dir and os.path.abspath(depth_dir)}
+    manifest = _load_manifest(output_dir)
+    # {文件名: 输入的 hash（--skip hash 时才有，否则是 None）}，只有用 chain 做完的文件才在里面
+    files = manifest.get("files", {}) if manifest.get("chain") == chain else {}
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    if manifest.get("chain") != chain:
+        # 在改写任何输出之前先记下新的操作链，进程被杀掉也不会留下旧操作链的文件列表
+        with open(manifest_path, "w") as f:
+            json.dump({"chain": chain, "files": files}, f)
+
+    t0 = time.time()
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+    jobs = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image_path = os.path.join(input_dir, filename)
+        depth_path = None if depth_dir is None else depth_path_for(depth_dir, filename)
+
+        if skip == "mtime" and filename in files:
+            try:
+                output_mtime = os.stat(os.path.join(output_dir, filename)).st_mtime
+                input_mtime = max(os.stat(p).st_mtime for p in filter(None, (image_path, depth_path)))
+                if output_mtime >= input_mtime:
+                    counts["skipped"] += 1
+                    continue
+            except OSError:
+                pass
+        jobs.append((filename, image_path, depth_path, files.get(filename)))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    print(f"{len(jobs)} images to process ({counts['skipped']} up to date), {len(chunks)} chunks, {workers} workers")
+
+    new_files = dict(files)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_process_chunk, chunk, ops, output_dir, skip, png_compression, prefetch)
+                       for chunk in chunks]
+            for n, future in enumerate(as_completed(futures), 1):
+                for filename, status, digest in future.result():
+                    if status in ("done", "skipped"):
+                        counts[status] += 1
+                        new_files[filename] = digest  # --skip mtime 重新做过的没有 hash
+                    else:
+                        counts["failed"] += 1
+                        new_files.pop(filename, None)
+                        print(f"{filename}: {status}")
+                if n % 10 == 0 or n == len(futures):
+                    print(f"{n}/{len(futures)} chunks, {counts}")
+    finally:
+        # 中途停下来也把已经做完的记下来，下次接着做
+        with open(manifest_path, "w") as f:
+            json.dump({"chain": chain, "files": new_files}, f)
+
+    counts["seconds"] = round(time.time() - t0, 1)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch flip / rotate / crop / depth-mask images with a process pool")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--ops", required=True, help="e.g. depth-mask=5.5,flip,rotate180,crop-quadrant=leftdown")
+    parser.add_argument("--depth", dest="depth_dir", help="aligned depth folder, required by depth-mask")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--skip", choices=["mtime", "hash", "none"], default="mtime")
+    parser.add_argument("--png-compression", type=int, default=1)
+    parser.add_argument("--prefetch", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    result = batch_transform(args.input_dir, args.output_dir, parse_ops(args.ops), depth_dir=args.depth_dir,
+                             workers=args.workers, skip=None if args.skip == "none" else args.skip,
+                             png_compression=args.png_compression, prefetch=args.prefetch)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
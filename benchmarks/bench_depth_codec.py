@@ -0,0 +1,73 @@
+'''
+Benchmark: scripts/save/depth_codec.py 里几种深度编码的编码速度、解码速度和压缩后大小。
+    python benchmarks/bench_depth_codec.py /path/to/depth_png_folder [max_frames]
+不给文件夹时用合成的深度图（斜面 + 噪声 + 空洞），只能粗略参考，最好用实际录的 depth 帧。
+每一帧都检查解码结果和原图逐像素相同。
+'''
+import os
+import sys
+import glob
+import time
+import numpy as np
+import cv2
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+from save.depth_codec import available_codecs, encode_depth, decode_depth
+
+
+def load_depth_frames(folder, max_frames):
+    paths = sorted(glob.glob(os.path.join(folder, "*.png")))[:max_frames]
+    frames = [cv2.imread(p, cv2.IMREAD_UNCHANGED) for p in paths]
+    return [f for f in frames if f is not None and f.dtype == np.uint16 and f.ndim == 2]
+
+
+def synthetic_depth_frames(n, rng, height=480, width=640):
+    yy, xx = np.mgrid[0:height, 0:width]
+    frames = []
+    for _ in range(n):
+        d = 2000 + xx * rng.uniform(1, 5) + yy * rng.uniform(1, 5) + rng.normal(0, 8, (height, width))
+        d = np.clip(d, 0, 65535).astype(np.uint16)
+        for _ in range(20):  # 没有深度的空洞
+            y, x = rng.integers(0, height - 40), rng.integers(0, width - 40)
+            d[y:y + rng.integers(5, 40), x:x + rng.integers(5, 40)] = 0
+        frames.append(d)
+    return frames
+
+
+def bench(frames, codec, level=None):
+    t0 = time.perf_counter()
+    encoded = [encode_depth(f, codec, level) for f in frames]
+    t_encode = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    decoded = [decode_depth(b, f.shape, codec) for b, f in zip(encoded, frames)]
+    t_decode = time.perf_counter() - t0
+
+    for f, d in zip(frames, decoded):
+        assert np.array_equal(f, d), f"{codec} is not lossless"
+    return t_encode, t_decode, sum(len(b) for b in encoded)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        frames = load_depth_frames(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 200)
+        print(f"{len(frames)} depth frames from {sys.argv[1]}")
+    else:
+        frames = synthetic_depth_frames(50, np.random.default_rng(0))
+        print(f"{len(frames)} synthetic depth frames")
+
+    raw_bytes = sum(f.nbytes for f in frames)
+    configs = [("raw", None)] + [("png", lvl) for lvl in (1, 3, 6)]
+    for codec in ("delta-lz4", "delta-zstd", "delta-zlib"):
+        if codec in available_codecs():
+            configs.append((codec, None))
+        else:
+            print(f"skip {codec} (package not installed)")
+
+    # 4 台相机 30 fps 需要每秒编码 120 帧
+    print(f"{'codec':>12} {'level':>6} {'enc fps':>9} {'dec fps':>9} {'enc MB/s':>9} {'ratio':>7}")
+    for codec, level in configs:
+        t_encode, t_decode, size = bench(frames, codec, level)
+        print(f"{codec:>12} {str(level if level is not None else '-'):>6} "
+              f"{len(frames) / t_encode:>9.1f} {len(frames) / t_decode:>9.1f} "
+              f"{raw_bytes / t_encode / 1e6:>9.1f} {size / raw_bytes:>7.3f}")
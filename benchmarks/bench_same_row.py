@@ -0,0 +1,100 @@
+'''
+Micro-benchmark: filter_label_file 里同一水平线去重的几种写法
+  loop    原来的双重循环（直接在 numpy 数组上索引）
+  window  先按 y_center 排序，用 searchsorted 只和 y 窗口里的框比较（numpy）
+  list    box_filter.same_row_keep，和原来一样的扫描顺序，但在 Python list 上做
+用随机生成的 label 数组（iou=0.1 时一帧可能有几百个框）比较速度，并检查三种写法结果完全一致。
+'''
+import os
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from box_filter import same_row_keep
+
+
+def same_row_keep_loop(xc, yc, y_threshold=0.15):
+    # 原来 filter_label_file 里的实现
+    keep = np.ones(len(yc), dtype=bool)
+    for i in range(len(keep)):
+        if not keep[i]:
+            continue
+        for j in range(i+1, len(keep)):
+            if not keep[j]:
+                continue
+            if abs(yc[i] - yc[j]) < y_threshold:
+                if xc[i] < xc[j]:
+                    keep[j] = False
+                else:
+                    keep[i] = False
+                    break
+    return keep
+
+
+def same_row_keep_window(xc, yc, y_threshold=0.15):
+    # 按 y 排序 + 窗口的写法，每个框只和 y 窗口里、原始顺序在它后面的框比较
+    n = len(yc)
+    keep = np.ones(n, dtype=bool)
+    order = np.argsort(yc, kind="stable")
+    ys = yc[order]
+    lo = np.searchsorted(ys, yc - y_threshold - 1e-9, side="left")
+    hi = np.searchsorted(ys, yc + y_threshold + 1e-9, side="right")
+    for i in range(n):
+        if not keep[i]:
+            continue
+        js = order[lo[i]:hi[i]]
+        js = np.sort(js[(js > i) & keep[js]])
+        js = js[np.abs(yc[i] - yc[js]) < y_threshold]
+        if js.size == 0:
+            continue
+        beaten = np.flatnonzero(xc[i] >= xc[js])
+        if beaten.size:
+            keep[js[:beaten[0]]] = False
+            keep[i] = False
+        else:
+            keep[js] = False
+    return keep
+
+
+def synthetic_labels(n, rng, clustered):
+    # class x_center y_center width height confidence
+    if clustered:  # 框集中在几棵树干附近，和真实的低 iou 结果比较像
+        centers = rng.random(max(3, n // 50))
+        y = (centers[rng.integers(0, len(centers), n)] + rng.normal(0, 0.02, n)) % 1
+    else:
+        y = rng.random(n)
+    arr = np.column_stack([
+        np.zeros(n),
+        rng.random(n) * 0.3,
+        y,
+        rng.random(n) * 0.2,
+        rng.random(n) * 0.2,
+        rng.random(n),
+    ])
+    return np.round(arr, 6)  # 和 label txt 里的精度一样
+
+
+def bench(fn, arr, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        keep = fn(arr[:, 1], arr[:, 2])
+    return (time.perf_counter() - t0) / repeat * 1000, keep
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+
+    for clustered in [True, False]:
+        print("clustered labels" if clustered else "uniform labels")
+        print(f"{'boxes':>6} {'loop (ms)':>10} {'window (ms)':>12} {'list (ms)':>10} {'speedup':>8}")
+        for n in [10, 50, 100, 200, 500, 1000, 3000]:
+            arr = synthetic_labels(n, rng, clustered)
+            repeat = max(5, 5000 // n)
+            t_loop, keep_loop = bench(same_row_keep_loop, arr, repeat)
+            t_window, keep_window = bench(same_row_keep_window, arr, repeat)
+            t_list, keep_list = bench(same_row_keep, arr, repeat)
+            assert np.array_equal(keep_loop, keep_window), f"window result mismatch at n={n}"
+            assert np.array_equal(keep_loop, keep_list), f"list result mismatch at n={n}"
+            print(f"{n:>6} {t_loop:>10.3f} {t_window:>12.3f} {t_list:>10.3f} {t_loop / t_list:>7.1f}x")
+        print()
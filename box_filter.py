@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def same_row_keep(xc, yc, y_threshold: float = 0.15) -> np.ndarray:
+    """
+    同一水平线上（|y_i - y_j| < y_threshold）只保留 x 最小（最靠近地面）的 bbx，返回 bool 的 keep 数组。
+    和 filter_label_file 里原来的双重循环结果完全一致（包括按原始顺序逐个比较的细节）。
+
+    原来的循环虽然是 O(N²) 的写法，但每条水平线上的框很快就被淘汰，实际接近线性，
+    真正慢的是每次 keep[j] / yc[j] 都是 numpy 标量索引。这里先转成 Python list 再扫，
+    按 y 排序再分窗口的写法也试过（见 benchmarks/bench_same_row.py），在密集的 label 上反而更慢。
+    """
+    xl = np.asarray(xc, dtype=np.float64).tolist()
+    yl = np.asarray(yc, dtype=np.float64).tolist()
+    n = len(yl)
+    keep = [True] * n
+
+    for i in range(n):
+        if not keep[i]:
+            continue
+        xi = xl[i]
+        yi = yl[i]
+        for j in range(i + 1, n):
+            if keep[j] and abs(yi - yl[j]) < y_threshold:
+                # 同水平线，删掉 x 更大的 （更高的）
+                if xi < xl[j]:
+                    keep[j] = False
+                else:
+                    keep[i] = False
+                    break
+
+    return np.array(keep, dtype=bool)
@@ -0,0 +1,110 @@
+'''
+并行数树：把多个行文件夹（例如每天每一侧的 flipped_filtered55）分给进程池，
+每个 worker 进程只加载一次模型，处理完的每一行结果再合并成一个报告。
+'''
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from detector_session import DetectorSession
+from detection_cache import DetectionCache
+from tree_counting_v2 import TreeCounter
+
+
+_session = None  # 每个 worker 进程自己的模型，进程启动时加载一次
+
+
+def _init_worker(weights, threads_per_worker, cache_db):
+    global _session
+    import torch
+    torch.set_num_threads(threads_per_worker)  # 防止多个进程各自开满所有核，互相抢 CPU
+    cache = DetectionCache(cache_db) if cache_db else None  # 每个进程自己的 SQLite 连接
+    _session = DetectorSession(weights, cache=cache)
+
+
+def count_row(row_dir, y_gap=0.3, batch_size=8, checkpoint_dir="checkpoints"):
+    """
+    在 worker 进程里数一行，返回这一行的结果。
+    每一行有自己的 checkpoint，崩溃后重新跑会从上次的位置接着处理。
+    """
+    t0 = time.time()
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    row_key = hashlib.md5(os.path.abspath(row_dir).encode()).hexdigest()[:12]
+    checkpoint = os.path.join(checkpoint_dir, f"{os.path.basename(row_dir.rstrip(os.sep))}_{row_key}.json")
+    counter = TreeCounter(_session, y_gap=y_gap, batch_size=batch_size, checkpoint=checkpoint)
+
+    trees = []
+    for event in counter.count_directory(row_dir):
+        identity = event["identity"]
+        if identity is None:  # 有效帧不够 5 帧，不算一棵树
+            continue
+        y_center, filename, ratio = identity
+        trees.append({
+            "tree": len(trees) + 1,
+            "identity_frame": filename,
+            "y_center": y_center[0],
+            "ratio": ratio,
+            "frames": event["frames"],
+        })
+
+    return {
+        "row": row_dir,
+        "tree_count": len(trees),
+        "trees": trees,
+        "seconds": round(time.time() - t0, 1),
+    }
+
+
+def count_rows(row_dirs, workers=None, weights="train3/weights/best.pt", y_gap=0.3,
+               batch_size=8, output_file="tree_count_report.json", checkpoint_dir="checkpoints",
+               cache_db="detection_cache.db"):
+    """
+    把 row_dirs 分给 workers 个进程并行处理，合并成一个报告写到 output_file。
+    """
+    report = {"weights": weights, "y_gap": y_gap, "total_trees": 0, "rows": []}
+    if not row_dirs:  # 没有行也写一个空报告，不启动进程池
+        with open(output_file, "w") as f:
+            json.dump(report, f, indent=4)
+        return report
+    if workers is None:
+        workers = (os.cpu_count() or 1) // 4
+    workers = max(1, min(len(row_dirs), workers))
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(weights, threads_per_worker, cache_db)) as pool:
+        futures = {pool.submit(count_row, row_dir, y_gap, batch_size, checkpoint_dir): row_dir for row_dir in row_dirs}
+        for future in as_completed(futures):
+            row_dir = futures[future]
+            try:
+                result = future.result()
+                print(f"{row_dir}: {result['tree_count']} trees in {result['seconds']} s")
+            except Exception as e:
+                print(f"Error counting trees in {row_dir}: {e}")
+                result = {"row": row_dir, "tree_count": None, "trees": [], "error": str(e)}
+            rows.append(result)
+
+    rows.sort(key=lambda r: row_dirs.index(r["row"]))  # 报告按输入的顺序排列
+    report["total_trees"] = sum(r["tree_count"] or 0 for r in rows)
+    report["rows"] = rows
+    with open(output_file, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Report saved to {output_file}")
+    return report
+
+
+if __name__ == '__main__':
+
+    base = "/Volumes/LaCie/Agrosense2/data_2025_7_22/data"
+    row_dirs = [
+        os.path.join(base, "250122075706/20250714_2046/flipped_filtered55"),
+        os.path.join(base, "033422071163/20250714_2046/flipped_filtered55"),
+        os.path.join(base, "243222071121/20250714_2046/flipped_filtered55"),
+        os.path.join(base, "243222071222/20250714_2046/flipped_filtered55"),
+    ]
+
+    report = count_rows(row_dirs, workers=4)
+    print("total trees:", report["total_trees"])
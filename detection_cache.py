@@ -0,0 +1,71 @@
+import sqlite3
+import hashlib
+import numpy as np
+
+
+class DetectionCache:
+    """
+    持久化的 YOLO 检测结果缓存（SQLite）。
+    key 是 (帧内容的 hash, 权重文件的 hash + iou)，value 是 (N,6) 检测框。
+    调 y_gap、threshold_norm、area_threshold 这些参数重新跑同一批帧时，
+    只需要重新做过滤和 tracking，不用再跑 YOLO。
+    """
+
+    def __init__(self, db_path="detection_cache.db"):
+        self.db_path = db_path
+        self.conn    = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # 多个 worker 进程同时读写
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_table()
+
+    def _create_table(self):
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS detections (
+            frame_hash TEXT,
+            model TEXT,
+            boxes BLOB,
+            PRIMARY KEY (frame_hash, model)
+        )
+        ''')
+        self.conn.commit()
+
+    def get(self, frame_hash, model):
+        row = self.conn.execute(
+            "SELECT boxes FROM detections WHERE frame_hash = ? AND model = ?",
+            (frame_hash, model)
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float64).reshape(-1, 6)
+
+    def put_many(self, items):
+        """
+        批量写入，items 是 [(frame_hash, model, boxes), ...]，一次 commit。
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO detections (frame_hash, model, boxes) VALUES (?, ?, ?)",
+            [(h, m, np.ascontiguousarray(b, dtype=np.float64).tobytes()) for h, m, b in items]
+        )
+        self.conn.commit()
+
+    def put(self, frame_hash, model, boxes):
+        self.put_many([(frame_hash, model, boxes)])
+
+    def close(self):
+        self.conn.close()
+
+
+def frame_hash(frame: np.ndarray) -> str:
+    """按解码后的像素算 hash，PNG、.bag、相机队列里的同一帧得到同一个 key"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(frame.shape).encode())
+    h.update(np.ascontiguousarray(frame).data)
+    return h.hexdigest()
+
+
+def file_hash(path, chunk_size=1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,249 @@
+from ultralytics import YOLO
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import queue
+import numpy as np
+import cv2
+
+from detection_cache import DetectionCache, frame_hash, file_hash
+
+
+class DetectorSession:
+    """
+    YOLO 检测会话：权重只加载一次，整个 run 里一直保持在内存中。
+    activetracking() 和 find_tree_coordinate() 共用同一个会话，
+    每一帧的检测结果会被缓存，同一帧不会被推理两次。
+
+    检测结果直接从 ultralytics 的 Results.boxes 取成 (N,6) 数组
+    （class x_center y_center width height confidence，归一化到 0~1），
+    不再经过 labels/*.txt 的写入和 np.loadtxt 的读取。
+    save / save_txt 打开时，标注图和 txt 由后台线程异步写到 project/name 下。
+
+    传入 DetectionCache 时，检测结果还会按 (帧内容 hash, 权重 hash + iou) 持久化到 SQLite，
+    之后换参数重新跑同一批帧时直接读缓存；所有帧都命中时连模型都不会加载。
+    """
+
+    def __init__(self, weights: str = "train3/weights/best.pt",
+                 project: str = "runs/detect", name: str = "predict5",
+                 iou: float = 0.1, cache_size: int = 2048,
+                 save: bool = False, save_txt: bool = False,
+                 cache: DetectionCache = None):
+        self.weights    = weights
+        self.project    = project
+        self.name       = name
+        self.iou        = iou
+        self.cache_size = cache_size   # 只需要覆盖一棵树的帧数即可，太大浪费内存
+        self.save       = save
+        self.save_txt   = save_txt
+
+        self.cache      = cache
+
+        self._model = None             # 第一次真正需要推理时才加载，之后一直复用
+        self._cache = OrderedDict()    # image_path -> (N,6) boxes
+        self.model_key = None
+        if cache is not None:
+            self.model_key = f"{file_hash(weights)}:{iou}"
+
+        # 异步写盘线程，队列有上限，写不过来时推理会等一下而不是无限占内存
+        self._save_queue  = None
+        self._save_thread = None
+        if save or save_txt:
+            self._save_queue  = queue.Queue(maxsize=64)
+            self._save_thread = threading.Thread(target=self._save_worker, daemon=True)
+            self._save_thread.start()
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = YOLO(self.weights)  # 只在这里加载一次
+        return self._model
+
+    def detect(self, image_path: str, frame: np.ndarray = None) -> np.ndarray:
+        """
+        返回该帧的检测框 (N,6)。已经检测过的帧直接从缓存返回。
+        frame 不为空时直接对内存里的图像推理（例如 .bag 或相机队列里的帧），image_path 只作为缓存的 key。
+        """
+        key = str(image_path)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        fh = None
+        if self.cache is not None:
+            if frame is None:
+                frame = cv2.imread(key)
+                if frame is None:
+                    raise FileNotFoundError(f"Cannot read image: {key}")
+            fh = frame_hash(frame)
+            boxes = self.cache.get(fh, self.model_key)
+            if boxes is not None:
+                self._remember(key, boxes)
+                return boxes
+
+        source = key if frame is None else frame
+        results = self.model(source, stream=True, iou=self.iou, verbose=False)
+        result = next(iter(results))
+        boxes = boxes_to_array(result)
+
+        if self._save_queue is not None:
+            self._save_queue.put((key, result))
+        if fh is not None:
+            self.cache.put(fh, self.model_key, boxes)
+
+        self._remember(key, boxes)
+        return boxes
+
+    def prefetch(self, paths, batch_size: int = 8, decode_workers: int = 4):
+        """
+        按 paths 的顺序批量推理，逐帧生成 (image_path, frame)。
+        下一批图片在后台线程里解码，和当前这一批的推理重叠；
+        推理结果写进缓存，之后 detect() 同一帧时直接命中，不会再跑模型。
+        调用方仍然一帧一帧按顺序处理，tracking 的逻辑完全不变。
+        """
+        paths = [str(p) for p in paths]
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        if not batches:
+            return
+
+        with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+            pending = [pool.submit(cv2.imread, p) for p in batches[0]]
+            for k, batch in enumerate(batches):
+                frames = [f.result() for f in pending]
+                if k + 1 < len(batches):  # 先把下一批交给解码线程，再推理当前批
+                    pending = [pool.submit(cv2.imread, p) for p in batches[k + 1]]
+
+                self._detect_frames(batch, frames)
+                for p, frame in zip(batch, frames):
+                    yield p, frame
+
+    def prefetch_frames(self, frames, batch_size: int = 8):
+        """
+        和 prefetch() 一样，但输入是已经解码好的 (key, frame) 流（.bag、相机队列等）。
+        攒够 batch_size 帧推理一次，再按原来的顺序逐帧生成 (key, frame)。
+        """
+        batch = []
+        for key, frame in frames:
+            batch.append((str(key), frame))
+            if len(batch) >= batch_size:
+                yield from self._flush_batch(batch)
+                batch = []
+        if batch:
+            yield from self._flush_batch(batch)
+
+    def _flush_batch(self, batch):
+        keys = [k for k, _ in batch]
+        frames = [f for _, f in batch]
+        self._detect_frames(keys, frames)
+        return zip(keys, frames)
+
+    def _detect_frames(self, batch, frames):
+        todo = [(p, f) for p, f in zip(batch, frames) if p not in self._cache]
+        for p, f in todo:
+            if f is None:
+                raise FileNotFoundError(f"Cannot read image: {p}")
+
+        hashes = {}
+        if self.cache is not None and todo:  # 先查持久化缓存，只推理没命中的帧
+            missed = []
+            for p, f in todo:
+                hashes[p] = frame_hash(f)
+                boxes = self.cache.get(hashes[p], self.model_key)
+                if boxes is None:
+                    missed.append((p, f))
+                else:
+                    self._remember(p, boxes)
+            todo = missed
+        if not todo:
+            return
+
+        results = self.model([f for _, f in todo], iou=self.iou, verbose=False)
+        new_entries = []
+        for (p, _), result in zip(todo, results):
+            if self._save_queue is not None:
+                self._save_queue.put((p, result))
+            boxes = boxes_to_array(result)
+            self._remember(p, boxes)
+            if p in hashes:
+                new_entries.append((hashes[p], self.model_key, boxes))
+        if new_entries:
+            self.cache.put_many(new_entries)
+
+    def label_path(self, image_path: str) -> str:
+        """
+        兼容旧接口：把该帧的检测框写成 YOLO label 文件并返回路径。
+        """
+        boxes = self.detect(image_path)
+
+        label_dir = Path(self.project) / self.name / "labels"
+        label_path = label_dir / f"{Path(image_path).stem}.txt"
+        if not label_path.exists():
+            label_dir.mkdir(parents=True, exist_ok=True)  # 确保标签目录存在
+            np.savetxt(label_path, boxes, fmt="%g")      # 没有检测结果时就是空 txt 文件
+        return str(label_path)
+
+    def close(self):
+        """等待后台写盘全部完成"""
+        if self._save_queue is not None:
+            self._save_queue.put(None)
+            self._save_thread.join()
+            self._save_queue = None
+
+    def _remember(self, key, boxes):
+        self._cache[key] = boxes
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)  # 丢掉最久没用过的帧
+
+    def _save_worker(self):
+        save_dir  = Path(self.project) / self.name
+        label_dir = save_dir / "labels"
+        label_dir.mkdir(parents=True, exist_ok=True)
+
+        while True:
+            item = self._save_queue.get()
+            if item is None:
+                break
+            image_path, result = item
+            stem = Path(image_path).stem
+            try:
+                if self.save:
+                    result.save(filename=str(save_dir / Path(image_path).name))
+                if self.save_txt:
+                    label_path = label_dir / f"{stem}.txt"
+                    if len(result.boxes):
+                        result.save_txt(str(label_path), save_conf=True)
+                    else:
+                        label_path.write_text("")
+            except Exception as e:
+                print(f"Failed to save detection of {image_path}: {e}")
+
+
+def boxes_to_array(result) -> np.ndarray:
+    """
+    把 ultralytics Results.boxes 转成 (N,6) 数组，列的顺序和 label 文件一致：
+      class x_center y_center width height confidence
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 6))
+
+    return np.column_stack([
+        boxes.cls.cpu().numpy(),
+        boxes.xywhn.cpu().numpy(),
+        boxes.conf.cpu().numpy(),
+    ]).astype(np.float64)
+
+
+_sessions = {}
+
+
+def get_session(weights: str = "train3/weights/best.pt", project: str = "runs/detect",
+                name: str = "predict5", iou: float = 0.1) -> DetectorSession:
+    """
+    按参数复用进程内已经创建好的会话，兼容旧的 yolo_detection(image_path) 调用方式。
+    """
+    key = (weights, project, name, iou)
+    if key not in _sessions:
+        _sessions[key] = DetectorSession(weights, project, name, iou)
+    return _sessions[key]
@@ -1,40 +1,183 @@
+'''
+批量统计 ROI 的非黑像素比例（调 tracker 参数用，几百万帧的量）：
+  每帧可以同时算多个 ROI，相同列带 [x, x+w) 的 ROI 共用一个 NonblackProfile（roi_ratio.py），
+  每个 ROI 只是两次前缀和相减；读帧用 roi_ratio.BandReader，只取所有 ROI 覆盖的行和列，
+  分段录制（raw）的帧是 mmap 上的 view，只有这几行会从磁盘读进来。PNG 不能只解码一部分，还是整帧解码。
+  文件分块交给进程池，结果按顺序一块一块追加写到 CSV（或者 Parquet，需要 pyarrow），中途停下来也不丢已经算完的。
+
+    python roi_nonblack_ratio.py 014/left/filtered_data_L14-55 roi_pixel_stats.csv
+'''
 import os
-import cv2
-import numpy as np
-import pandas as pd
-from glob import glob
+import sys
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+
+from roi_ratio import NonblackProfile, BandReader
+
+# 名字 -> (x, y, w, h)，默认就是原来的 ROI
+DEFAULT_ROIS = {"roi": (92, 197, 177, 65)}
+
+
+def roi_stats(frame, rois, row_offset=0, height=None, col_offset=0):
+    """
+    一帧所有 ROI 的 (黑色像素数, 非黑像素数, 非黑比例)，和原来 np.all(roi == [0, 0, 0], axis=-1) 的结果一样。
+    :param frame: 整帧，或者只是从 (row_offset, col_offset) 开始的一块
+    :param height: 整帧的高度，用来截断 ROI；None 表示 frame 一直到整帧的最后一行
+    :return: {名字: (black_pixels, color_pixels, ratio)}
+    """
+    height = frame.shape[0] + row_offset if height is None else height
+    profiles = {}
+    stats = {}
+    for name, (x, y, w, h) in rois.items():
+        if (x, w) not in profiles:
+            profiles[(x, w)] = NonblackProfile(frame, x=max(x - col_offset, 0), w=w)
+        profile = profiles[(x, w)]
+        y0 = min(max(y, 0), height) - row_offset
+        y1 = max(min(y + h, height) - row_offset, y0)
+        total = (y1 - y0) * profile.width
+        color = int(profile.prefix[y1] - profile.prefix[y0])
+        stats[name] = (total - color, color, color / total if total else 0.0)
+    return stats
+
+
+def row_range(rois):
+    """所有 ROI 覆盖的行 [y0, y1)，超出图像的部分读帧时切片自然截掉"""
+    y0 = min(max(y, 0) for _, y, _, _ in rois.values())
+    y1 = max(y + h for _, y, _, h in rois.values())
+    return y0, max(y0, y1)
+
+
+def column_range(rois):
+    """所有 ROI 覆盖的列 [x0, x1)"""
+    return min(max(x, 0) for x, _, _, _ in rois.values()), max(x + w for x, _, w, _ in rois.values())
+
+
+def columns(rois):
+    cols = ["filename"]
+    for name in rois:
+        cols += [f"{name}_black_pixels", f"{name}_color_pixels", f"{name}_non_black_ratio"]
+    return cols
+
+
+def _row(key, stats):
+    row = [key]
+    for black, color, ratio in stats.values():
+        row += [black, color, ratio]
+    return row
+
+
+def band_reader(source, rois, stream="rgb"):
+    """只读所有 ROI 覆盖的行和列的 BandReader"""
+    x0, x1 = column_range(rois)
+    y0, y1 = row_range(rois)
+    return BandReader(source, x=x0, w=x1 - x0, y=y0, h=y1 - y0, stream=stream)
+
+
+_reader = None  # worker 进程里的 BandReader，每个进程只列一次文件夹（或者打开一次分段录制）
+
+
+def _band_reader(source, rois, stream):
+    global _reader
+    if _reader is None or _reader[0] != (source, rois, stream):
+        if _reader is not None:
+            _reader[1].close()
+        _reader = ((source, rois, stream), band_reader(source, rois, stream))
+    return _reader[1]
+
+
+def _stats_chunk(source, indices, rois, stream):
+    """worker 进程：算一块帧（BandReader 里的下标），返回 CSV 的行"""
+    reader = _band_reader(source, rois, stream)
+    x0, _ = column_range(rois)
+    y0, _ = row_range(rois)
+    rows = []
+    for i in indices:
+        try:
+            band = reader.read(i)
+        except FileNotFoundError:  # 读不出来的 PNG 跳过
+            continue
+        key = reader.keys[i]
+        # 列带切到整帧的最后一行为止，height 用默认的 y0 + 列带的行数就对
+        rows.append(_row(key if reader.reader is not None else os.path.basename(key),
+                         roi_stats(band, rois, row_offset=y0, col_offset=x0)))
+    return rows
 
-# 设置参数
-folder_path = "014/left/filtered_data_L14-55"  # 示例路径
-x, y, w, h = 92, 197, 177, 65  # 你指定的 ROI 区域
 
-# 获取所有 PNG 文件
-image_files = sorted(glob(os.path.join(folder_path, "*.png")))
+class _TableWriter:
+    """一块一块追加写结果：.parquet 用 pyarrow，其它都写 CSV"""
 
-# 准备结果列表
-results = []
+    def __init__(self, path, cols):
+        self.cols = cols
+        self.parquet = path.endswith(".parquet")
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.pa, self.pq = pa, pq
+            self.path   = path
+            self.writer = None
+        else:
+            self.f = open(path, "w", newline="")
+            self.writer = csv.writer(self.f)
+            self.writer.writerow(cols)
 
-# 遍历每张图片
-for image_path in image_files:
-    img = cv2.imread(image_path)
-    if img is None:
-        continue
+    def write(self, rows):
+        if not rows:
+            return
+        if self.parquet:
+            table = self.pa.table({c: [r[k] for r in rows] for k, c in enumerate(self.cols)})
+            if self.writer is None:  # 第一块出来才知道 filename 列是字符串还是帧号
+                self.writer = self.pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            self.writer.writerows(rows)
+            self.f.flush()
 
-    # 提取 ROI
-    roi = img[y:y+h, x:x+w]
+    def close(self):
+        if self.parquet:
+            if self.writer is not None:
+                self.writer.close()
+        else:
+            self.f.close()
 
-    # 判断黑色像素
-    is_black = np.all(roi == [0, 0, 0], axis=-1)
-    black_pixels = int(np.sum(is_black))
-    color_pixels = int(roi.shape[0] * roi.shape[1] - black_pixels)
-    ratio = color_pixels / (roi.shape[0] * roi.shape[1])
 
-    filename = os.path.basename(image_path)
-    results.append([filename, black_pixels, color_pixels, ratio])
+def batch_roi_stats(source, output_path="roi_pixel_stats.csv", rois=None, workers=None, chunk_size=256,
+                    stream="rgb"):
+    """
+    :param source: PNG 文件夹，或者分段录制的文件夹（有 recording.json，读 stream 这一路）
+    :param rois: {名字: (x, y, w, h)}，默认 DEFAULT_ROIS
+    :return: 写了多少帧
+    """
+    rois = DEFAULT_ROIS if rois is None else rois
+    reader = band_reader(source, rois, stream)
+    total = len(reader)
+    reader.close()
+    chunks = [range(i, min(i + chunk_size, total)) for i in range(0, total, chunk_size)]
 
-# 保存为 Excel 表格
-df = pd.DataFrame(results, columns=["filename", "black_pixels", "color_pixels", "non_black_ratio"])
-excel_path = "roi_pixel_stats.xlsx"
-df.to_excel(excel_path, index=False)
+    t0 = time.time()
+    n = 0
+    table = _TableWriter(output_path, columns(rois))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map 按提交顺序返回，输出的行顺序和文件顺序一样
+            for k, rows in enumerate(pool.map(_stats_chunk, [source] * len(chunks), chunks,
+                                               [rois] * len(chunks), [stream] * len(chunks))):
+                table.write(rows)
+                n += len(rows)
+                if (k + 1) % 20 == 0:
+                    print(f"{n}/{total} frames, {n / (time.time() - t0):.0f} fps")
+    finally:
+        table.close()
+    print(f"{n} frames in {time.time() - t0:.1f} s, saved to {output_path}")
+    return n
 
 
+if __name__ == "__main__":
+    # 设置参数
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else "014/left/filtered_data_L14-55"  # 示例路径
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "roi_pixel_stats.csv"
+    rois = json.loads(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_ROIS  # '{"mid": [92, 197, 177, 65], ...}'
+    batch_roi_stats(folder_path, output_path, rois)
@@ -0,0 +1,135 @@
+import os
+import sys
+import glob
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+
+
+class NonblackProfile:
+    """
+    一帧图像在某个 x 列带 [x, x+w) 内的非黑像素逐行前缀和。
+    每帧只需要算一次，之后任意 y 窗口 [y, y+h) 的非黑比例都是 O(1)：
+      (prefix[y+h] - prefix[y]) / (行数 * 列数)
+    结果和 nonblack_ratio(image_path, x, y, w, h) 完全一致（包括 ROI 超出图像底部被截断的情况）。
+    frame 也可以是 bool 图，比如 scripts/utils/depth_utils.py 里深度有效位图解包出来的 DepthValidity.band(x, w)。
+    """
+
+    def __init__(self, frame: np.ndarray, x: int = 92, w: int = 177):
+        band = frame[:, x:x + w]
+        if band.ndim == 3 and band.dtype == np.uint8 and band.shape[-1] <= 4 and band.size:
+            # 三个通道只要有一个不是 0 就不是黑色：通道加起来（uint8 饱和加法）不是 0，
+            # cv2.transform 一次做完，比 np.any(band != 0, axis=-1) 快几倍
+            nonblack = cv2.transform(band, np.ones((1, band.shape[-1]), np.float32))
+        elif band.ndim == 3:
+            nonblack = np.any(band != 0, axis=-1)
+        else:
+            nonblack = band != 0
+
+        self.height = frame.shape[0]
+        self.width  = band.shape[1]
+        self.prefix = np.zeros(self.height + 1, dtype=np.int64)
+        np.cumsum(np.count_nonzero(nonblack, axis=1), out=self.prefix[1:])
+
+    def ratios(self, ys, h: int = 65) -> np.ndarray:
+        """
+        一次算出多个 y 窗口的非黑比例，ys 是窗口的起始行（像素）。
+        """
+        y0 = np.clip(np.asarray(ys, dtype=np.int64), 0, self.height)
+        y1 = np.minimum(y0 + h, self.height)
+        color_pixels = self.prefix[y1] - self.prefix[y0]
+        return color_pixels / ((y1 - y0) * self.width)
+
+    def ratio(self, y: int, h: int = 65) -> float:
+        return float(self.ratios([y], h)[0])
+
+
+class BandReader:
+    """
+    ROI 优先的读帧：下游（nonblack ratio、ROI 判断）只看翻转后每帧左边的列带 [x, x+w)，
+    这里只把这一块交出去，而且交出去的都是 view：
+      分段录制（raw，save/segment_recorder.py）：直接是 mmap 上的 view，不解码也不拷贝，
+        只碰到 ROI 用到的那些行；一行 640x3 字节比一页 4 KB 小，列带还是会把这些行所在的页读进来，
+        但不会再有整帧的拷贝在内存里来回搬。
+      PNG：没法只解码一部分，后台线程解码整帧以后马上切出列带拷贝一份（x=92, w=177 时不到整帧的 30%），
+        整帧当场就释放，预读队列里攒的只有列带。
+    列带的坐标从 0 开始，NonblackProfile(band, x=0, w=band.shape[1]) 和在整帧上用 (x, w) 的结果一样。
+
+        reader = BandReader("data/250122075706/20250714_2046", x=92, w=177)
+        for key, band in reader:
+            profile = NonblackProfile(band, x=0, w=band.shape[1])
+    """
+
+    def __init__(self, source, x=92, w=177, y=0, h=None, stream="rgb", decode_workers=4, prefetch=16):
+        """
+        :param source: PNG 文件夹（按文件名里的数字排序），或者分段录制的文件夹（有 recording.json）
+        :param y, h: 行范围 [y, y+h)，h=None 表示到最后一行
+        """
+        self.x, self.w = x, w
+        self.rows = slice(y, None if h is None else y + h)
+        self.stream = stream
+        self.decode_workers = decode_workers
+        self.prefetch = prefetch
+        self.reader = None
+        if os.path.isfile(os.path.join(source, "recording.json")):
+            from save.segment_recorder import SegmentReader
+            self.reader = SegmentReader(source)
+            self.keys = [int(n) for n in self.reader.frame_numbers(stream)]
+        else:
+            paths = glob.glob(os.path.join(source, "*.png"))
+            self.keys = sorted(paths, key=_frame_number)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _band(self, frame):
+        return frame[self.rows, self.x:self.x + self.w]
+
+    def _decode(self, path):
+        frame = cv2.imread(path)
+        if frame is None:
+            raise FileNotFoundError(f"Cannot read image: {path}")
+        return np.ascontiguousarray(self._band(frame))  # 只留列带，整帧在这里就释放了
+
+    def read(self, i):
+        """第 i 帧的列带"""
+        if self.reader is not None:
+            return self._band(self.reader.read(self.stream, i))
+        return self._decode(self.keys[i])
+
+    def bands(self, start=0):
+        """按顺序生成 (key, 列带)，PNG 在后台线程里预读 prefetch 帧"""
+        if self.reader is not None:
+            for i in range(start, len(self.keys)):
+                yield self.keys[i], self.read(i)
+            return
+
+        paths = self.keys[start:]
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as pool:
+            pending = [pool.submit(self._decode, p) for p in paths[:self.prefetch]]
+            for k, path in enumerate(paths):
+                band = pending[k].result()
+                pending[k] = None
+                if k + self.prefetch < len(paths):
+                    pending.append(pool.submit(self._decode, paths[k + self.prefetch]))
+                yield path, band
+
+    def __iter__(self):
+        return self.bands()
+
+    def profiles(self, start=0):
+        """按顺序生成 (key, NonblackProfile)，和在整帧上 NonblackProfile(frame, x, w) 的结果一样"""
+        for key, band in self.bands(start):
+            yield key, NonblackProfile(band, x=0, w=band.shape[1])
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+def _frame_number(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return (0, int(stem), stem) if stem.isdigit() else (1, 0, stem)
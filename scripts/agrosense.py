@@ -23,6 +23,9 @@ def start_agrosense():
     
     # 显示主窗口
     main_window.show()
+
+    # 退出前停掉相机和录制进程（它们不是 daemon，不停的话退出时会一直等），并释放共享内存
+    app.aboutToQuit.connect(taskManager.stop_cameras)
     
     # 进入应用程序的事件循环
     sys.exit(app.exec_())
@@ -0,0 +1,141 @@
+import sys
+import os
+sys.path.append("/usr/local/OFF")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # scripts/，从哪个目录运行都能 import save.* / utils.*
+import time
+import numpy as np
+import pyrealsense2 as rs
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from save.frame_writer import FrameWriter
+from save.segment_recorder import SegmentWriter
+from utils.registration import Registration
+
+
+def read_bag(bag_file, align=True):
+    """
+    逐帧读 .bag，生成 (帧号, 时间戳(秒), RGB, depth)。
+    align=True 时 depth 对齐到 RGB（rs.align），和采集时的 aligned_frames 一样；
+    align="lut" 时用事先算好的配准表（utils/registration.py）对齐；False 不对齐。
+    返回的是拷贝，librealsense 的 frame 可以马上释放回 frame pool。
+    """
+    pipeline = rs.pipeline()
+    config   = rs.config()
+    config.enable_device_from_file(bag_file, repeat_playback=False)
+    pipeline.start(config)
+    pipeline.get_active_profile().get_device().as_playback().set_real_time(False)  # 不按录制速度播放，解码多快就读多快
+    align_object = rs.align(rs.stream.color) if align is True else None
+    registration = Registration.from_profile(pipeline.get_active_profile()) if align == "lut" else None
+
+    try:
+        index = 0
+        while True:
+            try:
+                frames = pipeline.wait_for_frames(timeout_ms=1000)
+            except RuntimeError:  # RuntimeError 表示文件到达结尾
+                break
+
+            if align_object is not None:
+                frames = align_object.process(frames)
+            color_frame = frames.get_color_frame()
+            depth_frame = frames.get_depth_frame()
+            if not color_frame or not depth_frame:
+                continue
+
+            depth_image = np.asanyarray(depth_frame.get_data())
+            depth_image = registration.align(depth_image) if registration is not None else depth_image.copy()
+            yield (index, color_frame.get_timestamp() / 1000.0,
+                   np.asanyarray(color_frame.get_data()).copy(), depth_image)
+            index += 1
+    finally:
+        pipeline.stop()
+
+
+def ingest_bag(bag_file, output_folder, align=True, output="png", depth_codec="raw", level=None,
+               writer_workers=4, rgb_name="rgb", depth_name="depth"):
+    """
+    把一个 .bag 转出来。
+    :param output: "png"     每帧一个 PNG，写到 output_folder/rgb_name、output_folder/depth_name，编码和写盘在 FrameWriter 的线程里
+                   "segment" 写成分段录制文件（save/segment_recorder.py），depth 用 depth_codec 编码
+    :return: 统计信息 dict
+    """
+    t0 = time.time()
+    n_frames = 0
+
+    if output == "png":
+        rgb_folder   = os.path.join(output_folder, rgb_name)
+        depth_folder = os.path.join(output_folder, depth_name)
+        os.makedirs(rgb_folder, exist_ok=True)
+        os.makedirs(depth_folder, exist_ok=True)
+        # 离线转换不能丢帧：队列满了就一直等
+        writer = FrameWriter(workers=writer_workers, maxsize=64, block=True, put_timeout=None,
+                             png_compression=1 if level is None else level)
+        try:
+            for index, _, color_image, depth_image in read_bag(bag_file, align):
+                writer.submit(os.path.join(rgb_folder, f"{index:06d}.png"), color_image, copy=False)
+                writer.submit(os.path.join(depth_folder, f"{index:06d}.png"), depth_image, copy=False)
+                n_frames += 1
+        finally:
+            writer.close()
+        stats = writer.stats()
+
+    elif output == "segment":
+        recorder = None
+        try:
+            for index, timestamp, color_image, depth_image in read_bag(bag_file, align):
+                if recorder is None:  # 第一帧出来才知道分辨率
+                    recorder = SegmentWriter(
+                        output_folder,
+                        streams={"rgb": (color_image.shape, color_image.dtype),
+                                 "depth": (depth_image.shape, depth_image.dtype)},
+                        metadata={"bag_file": os.path.abspath(bag_file), "aligned": align},
+                        codecs={"depth": depth_codec},
+                        level=level,
+                    )
+                recorder.write("rgb", index, timestamp, color_image)
+                recorder.write("depth", index, timestamp, depth_image)
+                n_frames += 1
+        finally:
+            if recorder is not None:
+                recorder.close()
+        stats = {}
+
+    else:
+        raise ValueError(f"unknown output format: {output}")
+
+    seconds = time.time() - t0
+    return {"bag": bag_file, "output": output_folder, "frames": n_frames,
+            "seconds": round(seconds, 1), "fps": round(n_frames / seconds, 1) if seconds else 0.0, **stats}
+
+
+def ingest_bags(bag_files, output_root, processes=None, **kwargs):
+    """
+    多个 .bag 同时转换，每个 .bag 一个进程（解码和 align 都在各自进程里，不抢 GIL）。
+    每个 .bag 输出到 output_root/<bag 文件名>，其它参数和 ingest_bag 一样。
+    """
+    if processes is None:
+        processes = min(len(bag_files), max(1, (os.cpu_count() or 1) // 4))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {}
+        for bag_file in bag_files:
+            output_folder = os.path.join(output_root, os.path.splitext(os.path.basename(bag_file))[0])
+            futures[pool.submit(ingest_bag, bag_file, output_folder, **kwargs)] = bag_file
+        for future in as_completed(futures):
+            bag_file = futures[future]
+            try:
+                result = future.result()
+                print(f"{bag_file}: {result['frames']} frames in {result['seconds']} s ({result['fps']} fps)")
+            except Exception as e:
+                print(f"Error ingesting {bag_file}: {e}")
+                result = {"bag": bag_file, "error": str(e)}
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    # 直接数树（不落盘）用 tree_counting_v2.TreeCounter.count_bag
+    bag_files = [
+        "./Data/20241219_125103.bag",
+    ]
+    ingest_bags(bag_files, "./Data/ingested", output="png")
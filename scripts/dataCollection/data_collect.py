@@ -1,13 +1,20 @@
 import sys
 import os
 sys.path.append("/usr/local/OFF")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # scripts/，从哪个目录运行都能 import save.* / utils.*
 import time
 import cv2
 import numpy as np
 import pyrealsense2 as rs
+import queue
+import signal
 import multiprocessing
 from multiprocessing import Barrier, Process, Value, Queue, Event
-from utils.log import LoggerManager
+from utils.log import LoggerManager, RateLimitedLogger
+from utils.shared_frames import SharedFrameChannel
+from utils.frame_matcher import FrameMatcher
+from utils.registration import Registration
+from utils.capture_metrics import CameraMetrics, MetricsReporter
 import logging
 
 class DualCamera:
@@ -159,10 +166,18 @@ class DualCamera:
 
 logger_manager = LoggerManager()
 logger         = logger_manager.get_logger()
+# 采集和消费循环里每帧都可能触发的日志：参数延迟格式化，同一条消息 5 秒内最多输出一次
+hot_logger     = RateLimitedLogger(logger, interval=5.0)
 
 class SingleCamera:
     
-    def __init__(self, device_id, exposure, gain, width=640, height=480, fps=30):
+    def __init__(self, device_id, exposure, gain, width=640, height=480, fps=30, align="rs"):
+        """
+        :param align: depth 怎么对齐到 RGB
+                      "rs"  每帧 rs.align（原来的做法）
+                      "lut" 用事先算好的配准表（utils/registration.py），numpy 向量运算
+                      None  不对齐，发布原始 depth，需要的时候再用 self.registration.align()
+        """
 
         # initialize camera parameters
         self.width     = width
@@ -171,6 +186,7 @@ class SingleCamera:
         self.device_id = device_id
         self.exposure  = exposure
         self.gain      = gain
+        self.align     = align
 
         # debug if the data is really in the queue
         # self.rgb_path = "/home/agrisense/Documents/smartSprayer/data_store/rgb"
@@ -189,6 +205,7 @@ class SingleCamera:
             self.pipeline.start(config)
             logger.info(f"Camera {self.device_id} started.")
             self.align_object = rs.align(rs.stream.color)
+            self.registration = Registration.from_profile(self.pipeline.get_active_profile())
 
         except IndexError as e:
             logger.error(f"Error accessing sensor settings of device {self.device_id}: {e}")
@@ -208,6 +225,11 @@ class SingleCamera:
             self.sensor.set_option(rs.option.gain, self.gain)
             self.sensor.set_option(rs.option.enable_auto_white_balance, True)
 
+            # 帧时间戳换算到主机时钟（global time），不同相机的时间戳可以直接比较
+            for sensor in self.pipeline.get_active_profile().get_device().query_sensors():
+                if sensor.supports(rs.option.global_time_enabled):
+                    sensor.set_option(rs.option.global_time_enabled, 1)
+
         except IndexError as e:
             logger.error(f"Error accessing sensor settings of devce {self.device_id}: {e}")
 
@@ -217,65 +239,111 @@ class SingleCamera:
 
         logger.info(f"{self.device_id} is connected")
 
-    def capture(self, start_barrier, sync_barrier, frame_count, rgb_queue, depth_queue, stop_event):
-        
-        start_barrier.wait()  # 等待所有进程准备好再开始采集
+    def set_parameters(self, exposure=None, gain=None):
+        """更新曝光和增益（None 表示不改）"""
+        if exposure is not None:
+            self.sensor.set_option(rs.option.exposure, exposure)
+            self.exposure = exposure
+        if gain is not None:
+            self.sensor.set_option(rs.option.gain, gain)
+            self.gain = gain
+        logger.info(f"Camera {self.device_id}: exposure={self.exposure}, gain={self.gain}")
+
+    def handle_command(self, command, paused):
+        """
+        处理控制通道发来的命令，返回 (是否暂停, 是否停止)：
+          ("pause",) / ("resume",) / ("stop",) / ("set", exposure, gain)
+        """
+        name = command[0]
+        if name == "pause":
+            logger.info(f"Camera {self.device_id} paused.")
+            return True, False
+        if name == "resume":
+            logger.info(f"Camera {self.device_id} resumed.")
+            return False, False
+        if name == "stop":
+            return paused, True
+        if name == "set":
+            try:
+                self.set_parameters(*command[1:])
+            except Exception as e:
+                logger.error(f"Failed to update camera {self.device_id}: {e}")
+            return paused, False
+        logger.warning(f"Camera {self.device_id}: unknown command {command}")
+        return paused, False
+
+    def capture(self, start_barrier, sync_barrier, frame_count, rgb_channel, depth_channel, stop_event, metrics=None,
+                control=None):
+        """
+        采集 RGB 和 depth，写进共享内存环形缓冲区（SharedFrameChannel），
+        队列里只传 (帧号, 时间戳, 槽位号)，不再 pickle 整帧图像。
+        sync_barrier 为 None 时每个相机自由采集，不同相机的帧由消费者按时间戳配对（utils/frame_matcher.py）；
+        传 Barrier 则和以前一样逐帧同步。start_barrier 为 None 时不等其它相机直接开始。
+        metrics（utils/capture_metrics.py 的 CameraMetrics）记录帧率、延迟、等 barrier 的时间、丢帧和队列深度。
+        control 是控制通道（multiprocessing.Queue），命令见 handle_command()，每帧检查一次，不阻塞。
+        """
+        if start_barrier is not None:
+            start_barrier.wait()  # 等待所有进程准备好再开始采集
+        paused = False
         try:
             index = 0
             while not stop_event.is_set():  # 检查停止标志
-                try:
-                    sync_barrier.wait(timeout=5)  # 确保各个进程同步，设置超时阻止
-                except Exception as e:
-                    logger.warning(f"Barrier timeout for device {self.device_id}: {e}")
-                    time.sleep(0.1)  # 等待一小段时间
-                    continue  # 在超时的情况下继续循环
+                if control is not None:
+                    try:
+                        # 暂停时阻塞等命令（不取帧，librealsense 自己会丢掉旧帧）
+                        command = control.get(timeout=0.1) if paused else control.get_nowait()
+                    except queue.Empty:
+                        command = None
+                    if command is not None:
+                        paused, stop = self.handle_command(command, paused)
+                        if stop:
+                            break
+                    if paused:
+                        continue
+
+                barrier_wait = 0.0
+                if sync_barrier is not None:
+                    t_wait = time.time()
+                    try:
+                        sync_barrier.wait(timeout=5)  # 确保各个进程同步，设置超时阻止
+                    except Exception as e:
+                        hot_logger.warning("Barrier timeout for device %s: %s", self.device_id, e)
+                        time.sleep(0.1)  # 等待一小段时间
+                        continue  # 在超时的情况下继续循环
+                    barrier_wait = time.time() - t_wait
 
                 try:
-                    frame         = self.pipeline.wait_for_frames()
-                    aligned_frame = self.align_object.process(frame)
+                    frame = self.pipeline.wait_for_frames()
+                    if self.align == "rs":
+                        frame = self.align_object.process(frame)
 
-                    depth_frame = aligned_frame.get_depth_frame()
-                    color_frame = aligned_frame.get_color_frame()
+                    depth_frame = frame.get_depth_frame()
+                    color_frame = frame.get_color_frame()
 
                     if not depth_frame or not color_frame:
                         continue
 
-                    # 检查队列大小，确保不会阻塞
-                    if rgb_queue.qsize() >= 10:
-                        rgb_queue.get()  # 移除最旧的数据
-                        rgb_image = np.asanyarray(color_frame.get_data())
-                        rgb_queue.put_nowait(rgb_image)
-                        # cv2.imwrite(f'{self.rgb_path}/{self.device_id}/{index}.png',rgb_image)
-                        logger.info(f"Save rgb data (queue full): {self.device_id}")
-                    else:
-                        rgb_image = np.asanyarray(color_frame.get_data())
-                        rgb_queue.put_nowait(rgb_image)
-                        # cv2.imwrite(f'{self.rgb_path}/{self.device_id}/{index}.png',rgb_image)
-                        rgb_queue.put_nowait(rgb_image)
-                        logger.info(f"Save rgb data (queue not full): {self.device_id}")
-
-
-                    if depth_queue.qsize() >= 10:
-                        depth_queue.get()  # 移除最旧的数据
-                        depth_image = np.asanyarray(depth_frame.get_data())
-                        rgb_queue.put_nowait(depth_image)
-                        # cv2.imwrite(f'{self.rgb_path}/{self.device_id}/{index}.png',depth_image)
-                        depth_queue.put_nowait(np.asanyarray(depth_frame.get_data()))
-                        logger.info(f"Save Depth data (queue full): {self.device_id}")
-                    else:
-                        depth_image = np.asanyarray(depth_frame.get_data())
-                        rgb_queue.put_nowait(depth_image)
-                        # cv2.imwrite(f'{self.rgb_path}/{self.device_id}/{index}.png',depth_image)
-                        depth_queue.put_nowait(np.asanyarray(depth_frame.get_data()))
-                        logger.info(f"Save Depth data (queue not full): {self.device_id}")
+                    depth_image = np.asanyarray(depth_frame.get_data())
+                    if self.align == "lut":
+                        depth_image = self.registration.align(depth_image)
 
+                    timestamp = frame_timestamp(color_frame)
+                    # 从 librealsense 的 buffer 直接拷进共享内存槽位，消费者跟不上时旧的槽位会被覆盖
+                    rgb_channel.publish(index, timestamp, np.asanyarray(color_frame.get_data()))
+                    depth_channel.publish(index, timestamp, depth_image)
+                    index += 1
 
                     # 增加帧计数
                     with frame_count.get_lock():
                         frame_count.value += 1
-                        logger.debug(f"Captured frame {frame_count.value} from device {self.device_id}")
+
+                    if metrics is not None:
+                        metrics.frame(color_frame.get_frame_number(),
+                                      latency_ms=(time.time() - timestamp) * 1000,
+                                      barrier_wait_ms=barrier_wait * 1000,
+                                      queue_depth=rgb_channel.qsize())
                 except Exception as e:
-                    logger.error(f"Error capturing frames from device {self.device_id}: {e}")
+                    hot_logger.error("Error capturing frames from device %s: %s", self.device_id, e)
 
         finally:
             try:
@@ -284,10 +352,6 @@ class SingleCamera:
             except Exception as e:
                 logger.error(f"Error stopping pipeline for device {self.device_id}: {e}")
 
-            while not rgb_queue.empty()and depth_queue.empty():
-                rgb_queue.get()
-                depth_queue.get()
-
     def showImage(self, stop_event):
         """
         显示实时 RGB 图像，直到 stop_event 被设置。
@@ -327,128 +391,102 @@ class SingleCamera:
 
 
 
+def frame_timestamp(frame):
+    """相机的帧时间戳（秒）；不是 global time 的话换成主机收到帧的时间"""
+    if frame.get_frame_timestamp_domain() == rs.timestamp_domain.global_time:
+        return frame.get_timestamp() / 1000.0
+    return time.time()
+
+
 ########################TEST#######################################################################
-def setup_and_run(device_ids, start_barrier, sync_barrier, frame_count, rgb_queues, depth_queues, start_event, stop_event):
-    # cam = DualCamera(device_ids)
-    logger.info(f"Process for device {device_ids} is starting.")
-    cam = SingleCamera(device_ids, exposure, gain, width=640, height=480, fps=30)
-    logger.info(f"Device {device_ids} initialized successfully.")
-    start_event.wait()
-    logger.info(f"Device {device_ids} received start singal.")
-    cam.capture(start_barrier, sync_barrier, frame_count, rgb_queues, depth_queues, stop_event)
-    logger.info(f"Process for device {device_ids} has ended.")
-
-def rgb_data_consumer(rgb_queue1, rgb_queue2, stop_event):
+def rgb_data_consumer(rgb_channels, stop_event, tolerance=1 / 60):
+    """
+    直接在共享内存里读 RGB 帧（view，不拷贝）。需要保留的话自己 copy，
+    处理完用 is_current 检查处理期间有没有被生产者覆盖。
+    各相机的帧按时间戳配成一组（相差不超过 tolerance 秒），每组里每个相机一帧。
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主进程处理，通过 stop_event 停下来
     logger.info("RGB data consumer started.")
+    matcher = FrameMatcher(len(rgb_channels), tolerance=tolerance)
+    for channel in rgb_channels:
+        channel.attach()
 
-    # test if the image in the queue
-    i = 0
-    j = 0
     while not stop_event.is_set():
-        for queue in rgb_queue1:
-            if not queue.empty():
-                rgb_image = queue.get()
-                # cv2.imwrite(f'/home/agrisense/Documents/smartSprayer/data_store/rgbnew/033422071163/{i}.png', rgb_image)
-                # i = i+1
-                logger.debug("Processed an RGB frame.")
-        for queue in rgb_queue2:
-            if not queue.empty():
-                rgb_image = queue.get()
-                # cv2.imwrite(f'/home/agrisense/Documents/smartSprayer/data_store/rgbnew/033422071163/{j}.png', rgb_image)
-                # j = j+1
-                logger.debug("Processed an RGB frame.")
-    logger.info("RGB data consumer stopped.")
-
-def depth_data_consumer(depth_queue1, depth_queue2, stop_event):
+        received = False
+        for cam, channel in enumerate(rgb_channels):
+            item = channel.receive(timeout=0)
+            if item is None:
+                continue
+            received = True
+            index, timestamp, slot, _ = item
+            for group in matcher.add(cam, index, timestamp, slot):
+                images = [rgb_channels[c].ring.read(s, i) for c, (i, _, s) in enumerate(group)]
+                if any(image is None for image in images):
+                    hot_logger.warning("RGB frames %s were overwritten before matching.", [i for i, _, _ in group])
+                    continue
+                # cv2.imwrite(f'/home/agrisense/Documents/smartSprayer/data_store/rgbnew/033422071163/{index}.png', images[0])
+                if not all(rgb_channels[c].is_current(s, i) for c, (i, _, s) in enumerate(group)):
+                    hot_logger.warning("RGB frames %s were overwritten while processing.", [i for i, _, _ in group])
+                logger.debug("Processed a matched group of RGB frames.")
+        if not received:
+            time.sleep(0.001)  # 没有新帧时让出 CPU
+    for channel in rgb_channels:
+        channel.detach()
+    logger.info(f"RGB data consumer stopped. match stats: {matcher.stats()}")
+
+def depth_data_consumer(depth_channels, stop_event):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     logger.info("Depth data consumer started.")
+    for channel in depth_channels:
+        channel.attach()
 
-    # test if the image in the queue
-    i = 0
-    j = 0
     while not stop_event.is_set():
-        for queue in depth_queue1:
-            if not queue.empty():
-                depth_image = queue.get()
-                # cv2.imwrite(f'/home/agrisense/Documents/smartSprayer/data_store/depthnew/033422071163/{i}.png', rgb_image)
-                # i = i+1
-                logger.debug("Processed a depth frame.")
-
-        for queue in depth_queue2:
-            if not queue.empty():
-                depth_image = queue.get()
-                # cv2.imwrite(f'/home/agrisense/Documents/smartSprayer/data_store/depthnew/243222071121/{j}.png', rgb_image)
-                # j = j+1
+        received = False
+        for channel in depth_channels:
+            item = channel.receive(timeout=0)
+            if item is None:
+                continue
+            received = True
+            index, timestamp, slot, depth_image = item
+            # cv2.imwrite(f'/home/agrisense/Documents/smartSprayer/data_store/depthnew/243222071121/{index}.png', depth_image)
+            if not channel.is_current(slot, index):
+                hot_logger.warning("Depth frame %s was overwritten while processing.", index)
+            logger.debug("Processed a depth frame.")
+        if not received:
+            time.sleep(0.001)
+    for channel in depth_channels:
+        channel.detach()
     logger.info("Depth data consumer stopped.")
 
 
 
 if __name__ == '__main__':
-
-    device_id_pairs    = [('033422071163',), ('243222071121',)]
-    width, height, fps =640, 480, 30
-    exposure =  8
-    gain     = 1
-
-    if len(device_id_pairs[0]) == 2:
-        num = 2
-    else:
-        num = 1
-
-    # 创建两个同步带，分别用于启动和每一帧的同步
-
-    start_barrier = Barrier(parties=len(device_id_pairs))
-    sync_barrier  = Barrier(parties=len(device_id_pairs))
-    start_event   = Event()
-    stop_event    = Event()
-    processes     = []
-
-    # 用于计数捕获的帧数
-    frame_count_1 = Value('i', 0)  # 用于进程 1 的计数
-    frame_count_2 = Value('i', 0)  # 用于进程 2 的计数
-
-    # 创建RGB和深度数据的队列，每个相机都有自己的队列，限制最大长度为10
-    rgb_queues_1   = Queue(maxsize=10)
-    depth_queues_1 = Queue(maxsize=10)
-    rgb_queues_2   = Queue(maxsize=10) 
-    depth_queues_2 = Queue(maxsize=10) 
-
-    # 创建并启动两个摄像头进程
-    for idx, device_ids in enumerate(device_id_pairs):
-        if idx == 0:
-            p = Process(target=setup_and_run, args=(device_ids, start_barrier, sync_barrier, frame_count_1, rgb_queues_1, depth_queues_1, start_event, stop_event))
-        else:
-            p = Process(target=setup_and_run, args=(device_ids, start_barrier, sync_barrier, frame_count_2, rgb_queues_2, depth_queues_2, start_event, stop_event))
-        processes.append(p)
-
-    # 创建并启动消费者进程
-    rgb_consumer_process   = Process(target=rgb_data_consumer, args=(rgb_queues_1, rgb_queues_2, stop_event,))
-    depth_consumer_process = Process(target=depth_data_consumer, args=(depth_queues_1, depth_queues_2, stop_event,))
-    processes.extend([rgb_consumer_process, depth_consumer_process])
-
-    # 启动所有进程
-    for process in processes:
+    # 采集交给 CameraManager（manager/camera_manager.py）：每个相机一个进程，帧在共享内存里，
+    # 这里只启动两个消费者示例，从 CameraManager 的共享内存读帧，直到 Ctrl+C。
+    # 要录制的话用 camera_manager.main()（或者 collect_data_4cams.py / data_collect_2cams.py）
+    from manager.camera_manager import CameraManager
+
+    device_ids = ['033422071163', '243222071121']
+    manager    = CameraManager(device_ids, exposure=8, gain=1, width=640, height=480, fps=30)
+    manager.start()
+    manager.start_metrics_reporter("capture_metrics.jsonl")  # 每秒写一行采集指标
+
+    stop_event = Event()
+    consumers  = [
+        Process(target=rgb_data_consumer, args=([manager.rgb_channel(d) for d in device_ids], stop_event)),
+        Process(target=depth_data_consumer, args=([manager.depth_channel(d) for d in device_ids], stop_event)),
+    ]
+    for process in consumers:
         process.start()
-        logger.info("All processes have been started.")
+    logger.info("All processes have been started.")
 
-    start_event.set()
-    
-    # 等待所有进程完成
     try:
-        for process in processes[:len(device_id_pairs)]:
-            process.join()
-
-        stop_event.set()
-
-        for process in processes[len(device_id_pairs):]:
-            process.join()
+        while True:
+            time.sleep(0.5)
     except KeyboardInterrupt:
-        logger.warning("KeyboardInterrupt detected. Terminating processes...")
+        logger.warning("KeyboardInterrupt detected, stopping.")
+    finally:
         stop_event.set()
-        for process in processes:
-            process.terminate()
-        for process in processes:
+        for process in consumers:
             process.join()
-
-    logger.info(f"Frames captured by Camera 1: {frame_count_1.value}")
-    logger.info(f"Frames captured by Camera 2: {frame_count_2.value}")
-    
\ No newline at end of file
+        manager.stop()  # 停相机进程、释放共享内存，并输出每个相机的帧数和丢帧
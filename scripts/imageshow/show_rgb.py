@@ -1,9 +1,38 @@
 # imageshow_rgb.py
+import time
 import pyrealsense2 as rs
 import numpy as np
 import cv2
 from PyQt5.QtGui import QImage
 
+def to_qimage(color_image):
+    """BGR numpy 图像转成 QImage（QImage 要求 RGB 顺序）"""
+    rgb_image = cv2.cvtColor(color_image, cv2.COLOR_BGR2RGB)
+    h, w, ch = rgb_image.shape
+    bytes_per_line = ch * w
+    # copy() 让 QImage 拥有自己的数据，rgb_image 释放后还能用
+    return QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888).copy()
+
+
+def preview_from_manager(camera_manager, image_callback, stop_event, fps=15):
+    """
+    从 CameraManager 的共享内存里取每个相机最新的一帧，通过 image_callback(device_id, QImage) 传出去。
+    不打开 pipeline，可以和录制同时进行。
+    """
+    last = {}
+    while not stop_event.is_set() and camera_manager.running:
+        for device_id in camera_manager.device_ids:
+            channels = camera_manager.channels.get(device_id)
+            latest   = channels[0].ring.latest() if channels else None
+            if latest is None or last.get(device_id) == latest[0]:
+                continue
+            frame = camera_manager.latest_frame(device_id)
+            if frame is not None:
+                last[device_id] = latest[0]
+                image_callback(device_id, to_qimage(frame))
+        time.sleep(1 / fps)
+
+
 def start_rgb_stream(device_id, width, height, fps, exposure, gain, image_callback):
     """
     启动 RGB 图像采集，仅采集彩色图像。
@@ -41,13 +70,8 @@ def start_rgb_stream(device_id, width, height, fps, exposure, gain, image_callba
                 continue
             # 将彩色帧转换为 numpy 数组（BGR格式）
             color_image = np.asanyarray(color_frame.get_data())
-            # 将 BGR 转为 RGB（QImage 要求 RGB 顺序）
-            rgb_image = cv2.cvtColor(color_image, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            qimg = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
             # 通过回调函数传递图像数据
-            image_callback(device_id, qimg)
+            image_callback(device_id, to_qimage(color_image))
             # 等待1毫秒，防止占用过多CPU
             cv2.waitKey(1)
     except Exception as e:
@@ -1,51 +1,429 @@
 # camera_manager.py
-import pyrealsense2 as rs
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # scripts/，从哪个目录运行都能 import save.* / utils.*
+import csv
+import time
+import signal
+import queue
 import numpy as np
 import cv2
+from multiprocessing import Process, Queue, Event, Value
 from utils.log import LoggerManager
+from utils.shared_frames import SharedFrameChannel
+from utils.capture_metrics import CameraMetrics, MetricsReporter, metrics_snapshot
+from save.frame_writer import FrameWriter
+from save.segment_recorder import SegmentWriter
 
 logger_manager = LoggerManager()
 logger = logger_manager.get_logger()
 
 from dataCollection.data_collect import SingleCamera  # 假设 SingleCamera 定义在 dataCollect.py 中
 
+
+def _run_camera(device_id, exposure, gain, width, height, fps, align,
+                rgb_channel, depth_channel, control, ready, start_event, stop_event, frame_count, metrics,
+                info):
+    """
+    相机进程：RealSense pipeline 只在这个进程里打开，帧通过共享内存交给其它进程，
+    主进程通过 control 队列发暂停 / 继续 / 改曝光增益的命令。
+    打开 pipeline 以后把配准表（utils/registration.py）放进 info 队列，录制时存到录制文件夹里。
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主进程处理，通过 stop_event 停下来
+    try:
+        cam = SingleCamera(device_id, exposure, gain, width, height, fps, align=align)
+    except Exception as e:
+        logger.error(f"CameraManager: Failed to initialize camera {device_id}: {e}")
+        return
+    info.put(getattr(cam, "registration", None))
+    ready.set()
+
+    while not start_event.wait(0.5):
+        if stop_event.is_set():
+            cam.pipeline.stop()
+            return
+    cam.capture(None, None, frame_count, rgb_channel, depth_channel, stop_event, metrics, control)
+
+
+def _record_camera(device_id, rgb_channel, depth_channel, output_folder, save_format, depth_codec, level, stop_event,
+                   preprocess=None, registration=None, drain_timeout=5.0):
+    """
+    录制进程：从共享内存取同一帧号的 RGB 和 depth 写盘。
+      save_format="segment" 写成分段录制文件（save/segment_recorder.py）
+      save_format="png"     每帧一个 PNG，编码和写盘在 FrameWriter 的线程里，
+                            帧号和相机时间戳写到 timestamps.csv（不同相机的帧按它配对，utils/frame_matcher.py）
+    preprocess 是 utils.image_utils.DepthMaskFilter 时，RGB 写盘前先做深度截断 / 翻转 / 裁剪，
+    depth 做同样的翻转和裁剪，写下来的 RGB 和 depth 仍然逐像素对应，事后不用再跑 RGB_filter.py 和 flip.py。
+    registration 不为空时（相机不是用 rs.align 对齐的）存成 output_folder/registration.npz，
+    原始 depth 之后可以用 Registration.load() 再对齐。
+    stop_event 设置以后，把那一刻之前已经采到、还没写的帧写完再退出（最多再等 drain_timeout 秒）。
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 时也要等主进程发 stop_event，把帧写完
+    rgb_shape, depth_shape = rgb_channel.ring.shape, depth_channel.ring.shape
+    rgb_out = None
+    if preprocess is not None:
+        rgb_shape, depth_shape = preprocess.output_shape(rgb_shape), preprocess.output_shape(depth_shape)
+        rgb_out = np.empty(rgb_shape, dtype=rgb_channel.ring.dtype)  # 写分段文件时每帧复用
+
+    writer = recorder = timestamps = None
+    if save_format == "segment":
+        recorder = SegmentWriter(
+            output_folder,
+            streams={"rgb": (rgb_shape, rgb_channel.ring.dtype),
+                     "depth": (depth_shape, depth_channel.ring.dtype)},
+            metadata={"device_id": device_id,
+                      "preprocess": None if preprocess is None else preprocess.params()},
+            codecs={"depth": depth_codec},
+            level=level,
+        )
+    elif save_format == "png":
+        os.makedirs(os.path.join(output_folder, "rgb"), exist_ok=True)
+        os.makedirs(os.path.join(output_folder, "depth"), exist_ok=True)
+        writer = FrameWriter(workers=2, maxsize=64, png_compression=1 if level is None else level)
+        timestamps = open(os.path.join(output_folder, "timestamps.csv"), "w", newline="")
+        timestamps_csv = csv.writer(timestamps)
+        timestamps_csv.writerow(["frame_index", "timestamp"])
+    else:
+        raise ValueError(f"unknown save format: {save_format}")
+    if registration is not None:
+        registration.save(os.path.join(output_folder, "registration.npz"))
+
+    written = overwritten = 0
+    pending_depth = None
+    rgb_channel.attach()
+    depth_channel.attach()
+    last_index = None  # 收到停止信号时最新的帧号，写到这一帧为止（相机可能还在继续采集）
+    received   = -1    # 已经从队列里取到的最大帧号
+    try:
+        while True:
+            if last_index is None and stop_event.is_set():
+                latest = rgb_channel.ring.latest()
+                last_index = -1 if latest is None else latest[0]
+                deadline = time.time() + drain_timeout
+            if last_index is not None and (received >= last_index or time.time() > deadline):
+                break
+            # 元数据队列是 feeder 线程送过来的，停止以后队列暂时是空的不代表帧都到了，继续等到 last_index
+            item = rgb_channel.receive(timeout=0.1)
+            if item is None:
+                continue
+            index, timestamp, slot, rgb_image = item
+            received = max(received, index)
+            if last_index is not None and index > last_index:
+                break
+
+            # 同一帧的 depth 和 RGB 帧号相同，depth 比 RGB 早的（RGB 被覆盖丢掉了）跳过
+            depth_item, pending_depth = pending_depth, None
+            while depth_item is None or depth_item[0] < index:
+                depth_item = depth_channel.receive(timeout=0.1)
+                if depth_item is None:
+                    break
+            if depth_item is None:
+                continue
+            if depth_item[0] > index:
+                pending_depth = depth_item
+                continue
+            _, _, depth_slot, depth_image = depth_item
+
+            if preprocess is not None:
+                # PNG 交给 FrameWriter 的线程异步写，不能复用 rgb_out，每帧新建；depth 只是切片
+                rgb_image   = preprocess(rgb_image, depth_image, out=rgb_out if recorder is not None else None)
+                depth_image = preprocess.transform(depth_image)
+
+            if recorder is not None:
+                recorder.write("rgb", index, timestamp, rgb_image)
+                recorder.write("depth", index, timestamp, depth_image)
+            else:
+                writer.submit(os.path.join(output_folder, "rgb", f"{index:06d}.png"), rgb_image, copy=preprocess is None)
+                writer.submit(os.path.join(output_folder, "depth", f"{index:06d}.png"), depth_image)
+                timestamps_csv.writerow([index, repr(timestamp)])
+
+            # 写的过程中槽位被相机进程覆盖了，这一帧可能是新旧两帧混在一起的
+            if not (rgb_channel.is_current(slot, index) and depth_channel.is_current(depth_slot, index)):
+                overwritten += 1
+            written += 1
+    finally:
+        rgb_channel.detach()
+        depth_channel.detach()
+        if recorder is not None:
+            recorder.close()
+        if writer is not None:
+            writer.close()
+        if timestamps is not None:
+            timestamps.close()
+        logger.info(f"CameraManager: Recorded {written} frames of camera {device_id} to {output_folder} "
+                    f"({overwritten} overwritten while writing)")
+
+
 class CameraManager:
-    def __init__(self, device_ids, exposure, gain, width=640, height=480, fps=30):
+    def __init__(self, device_ids, exposure, gain, width=640, height=480, fps=30, align="rs", slots=30,
+                 camera_parameters=None):
         """
-        初始化多个相机, device_ids 是一个包含所有相机设备 ID 的列表
+        管理多个相机的采集服务，device_ids 是一个包含所有相机设备 ID 的列表。
+        每个相机一个采集进程（start() 时才打开 pipeline），帧放在共享内存环形缓冲区里，
+        GUI 预览、录制和实时处理都从这里读，不会重复打开 RealSense pipeline。
+        :param camera_parameters: 每个相机自己的曝光和增益 {device_id: {"exposure": 8, "gain": 1}}，没有的用 exposure / gain
+        :param slots: 每个相机环形缓冲区的槽位数（30 fps 时 30 个约 1 秒）
         """
-        self.cameras = {}
-        for device in device_ids:
+        self.device_ids = list(device_ids)
+        self.exposure   = exposure
+        self.gain       = gain
+        self.width      = width
+        self.height     = height
+        self.fps        = fps
+        self.align      = align
+        self.camera_parameters = camera_parameters or {}
+
+        self.channels     = {}  # {device_id: [rgb SharedFrameChannel, depth SharedFrameChannel]}
+        self.metrics      = {}  # 每个相机的采集指标
+        self.controls     = {}  # 每个相机的控制通道
+        self.frame_counts = {}
+        self.ready        = {}
+        self.infos        = {}  # 相机进程打开 pipeline 后把配准表放进来
+        self.registrations = {}
+        for device in self.device_ids:
+            self.channels[device] = [SharedFrameChannel((height, width, 3), np.uint8, slots=slots),
+                                     SharedFrameChannel((height, width), np.uint16, slots=slots)]
+            self.metrics[device]      = CameraMetrics()
+            self.controls[device]     = Queue()
+            self.frame_counts[device] = Value('i', 0)
+            self.ready[device]        = Event()
+            self.infos[device]        = Queue()
+
+        self.start_event = Event()
+        self.stop_event  = Event()
+        self.processes   = {}
+        self.recorders   = []
+        self.record_stop = None  # 当前这次录制的停止信号，停录制不影响相机进程
+        self.reporter    = None
+
+    @property
+    def running(self):
+        return self.start_event.is_set() and not self.stop_event.is_set()
+
+    @property
+    def recording(self):
+        return any(p.is_alive() for p in self.recorders)
+
+    def rgb_channel(self, device_id):
+        return self.channels[device_id][0]
+
+    def depth_channel(self, device_id):
+        return self.channels[device_id][1]
+
+    def start(self, timeout=15.0):
+        """
+        启动所有相机进程，等它们都打开 pipeline 之后同时开始采集。
+        :return: 成功启动的相机列表
+        """
+        if self.processes:
+            return [d for d in self.device_ids if self.ready[d].is_set()]
+
+        for device in self.device_ids:
+            params = self.camera_parameters.get(device, {})
+            p = Process(target=_run_camera, name=f"camera-{device}", args=(
+                device, params.get("exposure", self.exposure), params.get("gain", self.gain),
+                self.width, self.height, self.fps, self.align,
+                self.channels[device][0], self.channels[device][1], self.controls[device],
+                self.ready[device], self.start_event, self.stop_event,
+                self.frame_counts[device], self.metrics[device], self.infos[device]))
+            p.start()
+            self.processes[device] = p
+
+        deadline = time.time() + timeout
+        for device in self.device_ids:
+            if not self.ready[device].wait(max(0.0, deadline - time.time())):
+                logger.error(f"CameraManager: Camera {device} did not start within {timeout} s.")
+                continue
             try:
-                cam = SingleCamera(device, exposure, gain, width, height, fps)
-                self.cameras[device] = cam
-                logger.info(f"CameraManager: Camera {device} initialized.")
-            except Exception as e:
-                logger.error(f"CameraManager: Failed to initialize camera {device}: {e}")
+                self.registrations[device] = self.infos[device].get(timeout=1.0)
+            except queue.Empty:
+                self.registrations[device] = None
+        self.start_event.set()
+
+        started = [d for d in self.device_ids if self.ready[d].is_set()]
+        logger.info(f"CameraManager: Capturing from {started}")
+        return started
+
+    def _send(self, device_id, command):
+        devices = self.device_ids if device_id is None else [device_id]
+        for device in devices:
+            if device in self.controls:
+                self.controls[device].put(command)
+            else:
+                logger.error(f"CameraManager: Camera {device} not found.")
+
+    def pause(self, device_id=None):
+        """暂停采集（device_id 为 None 时暂停所有相机），pipeline 保持打开，恢复很快"""
+        self._send(device_id, ("pause",))
+
+    def resume(self, device_id=None):
+        self._send(device_id, ("resume",))
+
+    def update_camera_parameters(self, device_id, new_exposure, new_gain):
+        """
+        更新指定相机的参数：曝光和增益（通过控制通道发给相机进程，下一帧生效）
+        """
+        self.camera_parameters.setdefault(device_id, {}).update(exposure=new_exposure, gain=new_gain)
+        self._send(device_id, ("set", new_exposure, new_gain))
+        logger.info(f"CameraManager: Update camera {device_id}: exposure={new_exposure}, gain={new_gain}")
+
+    def record(self, output_root, save_format="segment", depth_codec="raw", level=None, preprocess=None):
+        """
+        每个相机启动一个录制进程，写到 output_root/<device_id>/<开始时间>。
+        同一时间只能有一组录制进程（两组会从同一个元数据队列里抢帧），正在录制时抛 RuntimeError，
+        要先 stop_recording()。
+        :param preprocess: utils.image_utils.DepthMaskFilter，写盘前对 RGB 做深度截断 / 翻转 / 裁剪（需要 align）
+        """
+        if self.recording:
+            raise RuntimeError("CameraManager is already recording, call stop_recording() first")
+        self.recorders   = []
+        self.record_stop = Event()
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
+        for device in self.device_ids:
+            output_folder = os.path.join(output_root, device, stamp)
+            p = Process(target=_record_camera, name=f"record-{device}", args=(
+                device, self.channels[device][0], self.channels[device][1], output_folder,
+                save_format, depth_codec, level, self.record_stop, preprocess,
+                # rs.align 对齐过的 depth 不需要配准表，其它情况（"lut" 或者不对齐）都存一份
+                None if self.align == "rs" else self.registrations.get(device)))
+            p.start()
+            self.recorders.append(p)
+            logger.info(f"CameraManager: Recording camera {device} to {output_folder}")
+
+    def stop_recording(self, timeout=30.0):
+        """
+        停止录制（相机进程继续采集，预览不受影响）。录制进程把共享内存里还没写的帧写完再退出。
+        """
+        if self.record_stop is None:
+            return
+        self.record_stop.set()
+        for p in self.recorders:
+            p.join(timeout)
+            if p.is_alive():
+                logger.warning(f"CameraManager: Recorder {p.name} did not exit, terminating.")
+                p.terminate()
+                p.join()
+        self.recorders   = []
+        self.record_stop = None
+
+    def latest_frame(self, device_id, stream="rgb"):
+        """
+        最新的一帧（拷贝），给 GUI 预览用，不影响录制和其它消费者。没有帧时返回 None。
+        """
+        channel = self.channels[device_id][0 if stream == "rgb" else 1]
+        latest = channel.ring.latest()
+        if latest is None:
+            return None
+        index, slot, view = latest
+        frame = view.copy()
+        if not channel.is_current(slot, index):  # 拷贝的时候被覆盖了，下次再取
+            return None
+        return frame
 
     def show_camera_image(self, device_id, stop_event):
         """
-        调用指定相机的 showImage 方法显示实时图像
+        用 OpenCV 窗口显示指定相机的实时图像（从共享内存读），直到 stop_event 被设置或者按 q
         """
-        if device_id in self.cameras:
-            logger.info(f"CameraManager: Showing image for camera {device_id}.")
-            self.cameras[device_id].showImage(stop_event)
-        else:
+        if device_id not in self.channels:
             logger.error(f"CameraManager: Camera {device_id} not found.")
+            return
+        logger.info(f"CameraManager: Showing image for camera {device_id}.")
+        try:
+            while not stop_event.is_set():
+                frame = self.latest_frame(device_id)
+                if frame is not None:
+                    cv2.imshow(f"Camera {device_id}", frame)
+                if cv2.waitKey(int(1000 / self.fps)) & 0xFF == ord('q'):
+                    break
+        finally:
+            cv2.destroyAllWindows()
 
-    def update_camera_parameters(self, device_id, new_exposure, new_gain):
+    def collect(self, duration, output_root, metrics_path="capture_metrics.jsonl", **record_kwargs):
         """
-        更新指定相机的参数：曝光和增益
+        采集 duration 秒（None 表示直到 Ctrl+C），录制到 output_root，期间每秒记录一次采集指标
         """
-        if device_id in self.cameras:
-            cam          = self.cameras[device_id]
-            cam.exposure = new_exposure
-            cam.gain     = new_gain
-            try:
-                cam.sensor.set_option(rs.option.exposure, new_exposure)
-                cam.sensor.set_option(rs.option.gain, new_gain)
-                logger.info(f"CameraManager: Updated camera {device_id}: exposure={new_exposure}, gain={new_gain}")
-            except Exception as e:
-                logger.error(f"CameraManager: Failed to update camera {device_id}: {e}")
-        else:
-            logger.error(f"CameraManager: Camera {device_id} not found.")
+        self.start()
+        self.record(output_root, **record_kwargs)
+        self.start_metrics_reporter(metrics_path)
+        try:
+            t_start = time.time()
+            while duration is None or time.time() - t_start < duration:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            logger.warning("CameraManager: KeyboardInterrupt detected, stopping.")
+        finally:
+            self.stop()
+
+    def stop(self, timeout=10.0):
+        """停止所有相机和录制进程，释放共享内存"""
+        self.stop_event.set()
+        for device, p in self.processes.items():
+            p.join(timeout)
+            if p.is_alive():
+                logger.warning(f"CameraManager: Camera process {device} did not exit, terminating.")
+                p.terminate()
+                p.join()
+        self.stop_recording()
+        self.stop_metrics_reporter()
+
+        for device in self.device_ids:
+            m = self.get_metrics().get(device, {})
+            logger.info(f"CameraManager: Camera {device} captured {self.frame_counts[device].value} frames, "
+                        f"camera drops {m.get('camera_drops')}, consumer drops {m.get('consumer_drops')}")
+        for channels in self.channels.values():
+            for channel in channels:
+                channel.close(unlink=True)
+        self.processes = {}
+        self.channels  = {}
+
+    def get_metrics(self):
+        """
+        所有相机当前的采集指标 {device_id: {"fps", "latency_ms", "camera_drops", "consumer_drops", ...}}，给 GUI 用
+        """
+        return metrics_snapshot(self.metrics, self.channels)
+
+    def start_metrics_reporter(self, path="capture_metrics.jsonl", interval=1.0, callback=None):
+        """
+        每 interval 秒把指标写一行 JSON 到 path，并调用 callback(snapshot)
+        """
+        if self.reporter is None:
+            self.reporter = MetricsReporter(self.metrics, path, interval, callback, self.channels).start()
+        return self.reporter
+
+    def stop_metrics_reporter(self):
+        if self.reporter is not None:
+            self.reporter.stop()
+            self.reporter = None
+
+
+def main(argv=None, **defaults):
+    """
+    采集的命令行入口：启动相机、录制 duration 秒、停止。
+    dataCollection/collect_data_4cams.py 和 data_collect_2cams.py 只是带各自的默认参数调用这里，
+    defaults 的名字和命令行参数一样（devices、exposure、gain、duration、output、format、depth_codec、level、align）。
+        python scripts/manager/camera_manager.py --devices 033422071163 243222071121 --format png --duration 60
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Capture from RealSense cameras through CameraManager")
+    parser.add_argument("--devices", nargs="+", default=['250122075706', '033422071163', '243222071121', '243222071222'])
+    parser.add_argument("--exposure", type=int, default=8)
+    parser.add_argument("--gain", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=300, help="seconds, 0 records until Ctrl+C")
+    parser.add_argument("--output", default="data", help="recordings go to <output>/<device_id>/<start time>")
+    parser.add_argument("--format", choices=["segment", "png"], default="segment")
+    parser.add_argument("--depth-codec", default="raw", help="segment only: raw / png / delta-lz4 / delta-zstd / delta-zlib")
+    parser.add_argument("--level", type=int, default=None, help="compression level")
+    parser.add_argument("--align", choices=["rs", "lut", "none"], default="rs",
+                        help="none records raw depth plus registration.npz")
+    parser.add_argument("--metrics", default="capture_metrics.jsonl")
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+
+    manager = CameraManager(args.devices, exposure=args.exposure, gain=args.gain,
+                            align=None if args.align == "none" else args.align)
+    manager.collect(duration=args.duration or None, output_root=args.output, metrics_path=args.metrics,
+                    save_format=args.format, depth_codec=args.depth_codec, level=args.level)
+
+
+if __name__ == '__main__':
+    main()
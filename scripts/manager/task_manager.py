@@ -8,7 +8,7 @@ from multiprocessing import Barrier, Process, Value, Queue, Manager
 from queue import Empty
 import threading
 
-from imageshow.show_rgb import start_rgb_stream
+from imageshow.show_rgb import start_rgb_stream, preview_from_manager
 from manager.data_collect_manager import DataCollectManager
 from manager.camera_manager import CameraManager
 from localization.agro_nav import USB2Navigator
@@ -29,7 +29,9 @@ class TaskManager:
         self.fps    = fps
         self.camera_params = camera_parameters
         self.USB2Nav = USB2Navigator()
-        #self.cameraManager = CameraManager()
+        self.cameraManager = None  # 相机采集服务，第一次预览或者开始采集时启动
+        self.preview_stop  = threading.Event()
+        self.preview_thread = None  # 预览线程，停相机之前要等它退出（它手里可能还有共享内存的 view）
         
     def initialization():
         pass
@@ -43,36 +45,86 @@ class TaskManager:
         all_params = [device_id for pair in self.device_id_pairs for device_id in pair]  # 展开所有元组元素
         return len(all_params), all_params  # 返回参数总数和展开后的列表
 
+    def start_cameras(self):
+        """
+        启动相机采集服务（CameraManager，每个相机一个进程），已经启动的话直接返回。
+        预览、录制都共用这一组 pipeline。
+        """
+        if self.cameraManager is None:
+            count, camera_list = self.extract_camera_parameters()
+            print(f"检测到 {count} 个相机: {camera_list}")
+            self.cameraManager = CameraManager(camera_list, exposure, gain, self.width, self.height, self.fps,
+                                               camera_parameters=self.camera_params)
+            self.cameraManager.start()
+        return self.cameraManager
+
+    def stop_cameras(self):
+        """停止预览、录制和所有相机进程，释放共享内存（GUI 退出时调用，见 agrosense.py）"""
+        self.preview_stop.set()
+        if self.preview_thread is not None:
+            # 先等预览线程放下共享内存里的 view，CameraManager.stop() 才能关掉并释放共享内存
+            self.preview_thread.join(timeout=5)
+            self.preview_thread = None
+        if self.cameraManager is not None:
+            self.cameraManager.stop()
+            self.cameraManager = None
+        self.preview_stop = threading.Event()
+
     def show_all_cameras(self, image_callback):
         """
-        对所有相机启动图像采集（只采集RGB图像），并通过 image_callback(device_id, QImage)
-        将采集到的图像传递出去。
+        对所有相机启动图像采集，并通过 image_callback(device_id, QImage)
+        将采集到的 RGB 图像传递出去。图像从 CameraManager 的共享内存里取，
+        开始录制时不会再打开一次 pipeline。
         :param image_callback: 回调函数，用于传出采集的图像数据
         """
-        count, camera_list = self.extract_camera_parameters()
-        print(f"检测到 {count} 个相机: {camera_list}")
-        threads = []
-        for device_id in camera_list:
-            # 根据设备ID从 camera_params 中获取对应的曝光和增益
-            params = self.camera_params.get(device_id, {})
-            exposure = params.get('exposure', 8)  # 如果没有指定，则使用默认值8
-            gain = params.get('gain', 1)          # 默认值1
-
-            t = threading.Thread(
-                target=start_rgb_stream,
-                args=(device_id, self.width, self.height, self.fps, exposure, gain, image_callback)
-            )
-            t.daemon = True  # 主程序退出时，线程自动结束
-            t.start()
-            threads.append(t)
-        # 如有需要，可等待所有线程结束（通常GUI程序中不建议阻塞）
-        # for t in threads:
-        #     t.join()
-
-    def dataCollectTask(self):
+        camera_manager = self.start_cameras()
+        if self.preview_thread is not None and self.preview_thread.is_alive():
+            return  # 已经在预览
+        self.preview_thread = threading.Thread(
+            target=preview_from_manager,
+            args=(camera_manager, image_callback, self.preview_stop)
+        )
+        self.preview_thread.daemon = True  # 主程序退出时，线程自动结束
+        self.preview_thread.start()
+
+    def update_camera_parameters(self, device_id, new_exposure, new_gain):
+        """通过控制通道更新正在采集的相机的曝光和增益"""
+        self.camera_params.setdefault(device_id, {}).update(exposure=new_exposure, gain=new_gain)
+        if self.cameraManager is not None:
+            self.cameraManager.update_camera_parameters(device_id, new_exposure, new_gain)
+
+    def get_capture_metrics(self):
+        """
+        采集指标（帧率、延迟、丢帧、队列深度），CameraPage 每秒取一次显示
+        :return: {device_id: {指标名: 值}}，相机还没有启动时返回 {}
+        """
+        camera_manager = getattr(self, "cameraManager", None)
+        if camera_manager is None:
+            return {}
+        return camera_manager.get_metrics()
+
+    def dataCollectTask(self, output_root="data", save_format="segment", depth_codec="raw"):
+        """
+        开始采集：启动相机（已经在预览的话直接用），每个相机一个录制进程写到 output_root，
+        采集指标每秒写一行到 output_root/capture_metrics.jsonl
+        """
+        if self.is_collecting():
+            raise RuntimeError("Data collection is already running")
+        camera_manager = self.start_cameras()
+        camera_manager.record(output_root, save_format=save_format, depth_codec=depth_codec)
+        os.makedirs(output_root, exist_ok=True)
+        camera_manager.start_metrics_reporter(os.path.join(output_root, "capture_metrics.jsonl"))
+
+    def is_collecting(self):
+        return self.cameraManager is not None and self.cameraManager.recording
+
+    def stopDataCollection(self):
+        """停止录制，相机继续采集（预览不受影响）"""
+        if self.cameraManager is not None:
+            self.cameraManager.stop_recording()
+            self.cameraManager.stop_metrics_reporter()
         # self.dataCollector = DataCollectManager(self.cameraManager)
         # self.dataCollector.start()
-        pass
 
 
     def realtime_proces_task(self):
@@ -0,0 +1,102 @@
+# depth_codec.py
+'''
+16 位深度图的几种无损编码，录制时可以按 CPU 和磁盘的情况选：
+    raw         不压缩，直接存 z16
+    png         16 位 PNG，level 是 cv2 的压缩级别 0-9（默认 1，cv2 默认是 3）
+    delta-lz4   每行做水平差分 -> zigzag -> 高低字节分开 -> LZ4，编码非常快
+    delta-zstd  同样的预处理 -> zstd，压缩率比 LZ4 高，level 默认 1
+    delta-zlib  同样的预处理 -> zlib，不需要额外安装包
+
+深度图相邻像素差别很小，差分之后大部分值落在 -128~127，
+zigzag 以后高字节几乎全是 0，高低字节分开放压缩器就很容易压。
+所有编码都是无损的，解码结果和原始深度图逐像素相同。
+'''
+import zlib
+import numpy as np
+import cv2
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODECS = ["raw", "png", "delta-lz4", "delta-zstd", "delta-zlib"]
+
+
+def available_codecs():
+    """当前环境能用的编码（lz4 / zstandard 没装的话对应的编码不能用）"""
+    codecs = ["raw", "png", "delta-zlib"]
+    if lz4_frame is not None:
+        codecs.append("delta-lz4")
+    if zstandard is not None:
+        codecs.append("delta-zstd")
+    return codecs
+
+
+def _delta_planes(depth):
+    """水平差分 + zigzag + 高低字节分开，返回 bytes"""
+    depth = np.ascontiguousarray(depth, dtype=np.uint16)
+    delta = np.empty_like(depth)
+    delta[:, 0]  = depth[:, 0]
+    delta[:, 1:] = depth[:, 1:] - depth[:, :-1]  # uint16 减法会回绕，解码时累加回来也是回绕，不丢精度
+    s = delta.view(np.int16)
+    z = ((s << 1) ^ (s >> 15)).view(np.uint16)
+    return np.ascontiguousarray(z.astype("<u2").view(np.uint8).reshape(-1, 2).T).tobytes()
+
+
+def _undelta_planes(data, shape):
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(2, -1)
+    z = np.ascontiguousarray(planes.T).view("<u2").reshape(shape).astype(np.uint16)
+    delta = (z >> 1) ^ (-(z & 1)).astype(np.uint16)
+    return np.cumsum(delta, axis=1, dtype=np.uint16)
+
+
+def encode_depth(depth, codec="raw", level=None):
+    """
+    :param depth: (H, W) uint16 深度图
+    :param codec: CODECS 里的一种
+    :param level: 压缩级别，None 用每种编码的默认值
+    :return: bytes
+    """
+    if codec == "raw":
+        return np.ascontiguousarray(depth, dtype="<u2").tobytes()
+    if codec == "png":
+        ok, buf = cv2.imencode(".png", depth, [cv2.IMWRITE_PNG_COMPRESSION, 1 if level is None else level])
+        if not ok:
+            raise ValueError("PNG encode failed")
+        return buf.tobytes()
+    if codec == "delta-lz4":
+        if lz4_frame is None:
+            raise ImportError("delta-lz4 needs the lz4 package: pip install lz4")
+        return lz4_frame.compress(_delta_planes(depth), compression_level=0 if level is None else level)
+    if codec == "delta-zstd":
+        if zstandard is None:
+            raise ImportError("delta-zstd needs the zstandard package: pip install zstandard")
+        return zstandard.ZstdCompressor(level=1 if level is None else level).compress(_delta_planes(depth))
+    if codec == "delta-zlib":
+        return zlib.compress(_delta_planes(depth), 1 if level is None else level)
+    raise ValueError(f"unknown depth codec: {codec}")
+
+
+def decode_depth(data, shape, codec="raw"):
+    """
+    :param data: encode_depth 的结果（bytes / memoryview）
+    :param shape: (H, W)
+    :return: (H, W) uint16 深度图
+    """
+    if codec == "raw":
+        return np.frombuffer(data, dtype="<u2").reshape(shape)
+    if codec == "png":
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if codec == "delta-lz4":
+        return _undelta_planes(lz4_frame.decompress(data), shape)
+    if codec == "delta-zstd":
+        return _undelta_planes(zstandard.ZstdDecompressor().decompress(data), shape)
+    if codec == "delta-zlib":
+        return _undelta_planes(zlib.decompress(data), shape)
+    raise ValueError(f"unknown depth codec: {codec}")
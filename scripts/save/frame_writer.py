@@ -0,0 +1,103 @@
+# frame_writer.py
+import os
+import time
+import queue
+import threading
+import cv2
+
+
+class FrameWriter:
+    """
+    异步写图：采集循环只负责把图像放进一个有上限的队列，
+    后台的几个线程负责 PNG 编码和写盘（cv2.imwrite 编码时会释放 GIL，线程就够了）。
+
+    队列满了（写盘跟不上）时的处理方式：
+      block=True  采集循环最多等 put_timeout 秒（back-pressure），还是满的就丢掉这一帧
+      block=False 直接丢掉这一帧
+    丢帧数、队列深度等指标可以用 stats() 取。
+    """
+
+    def __init__(self, workers=4, maxsize=64, block=True, put_timeout=0.05,
+                 png_compression=1):
+        self.block       = block
+        self.put_timeout = put_timeout
+        # cv2 默认压缩级别是 3，实时采集用 1 快很多，文件只大一点
+        self.params      = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+
+        self.queue   = queue.Queue(maxsize=maxsize)
+        self.lock    = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed  = 0
+        self.max_depth  = 0
+        self.write_time = 0.0   # 所有写盘的累计耗时（秒）
+
+        self.threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"FrameWriter-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, path, image, copy=True):
+        """
+        把一帧交给后台写盘，返回 True；队列满丢帧时返回 False。
+        librealsense 的 buffer 会被复用，所以默认先拷贝一份。
+        """
+        if copy:
+            image = image.copy()
+        try:
+            if self.block:
+                self.queue.put((path, image), timeout=self.put_timeout)
+            else:
+                self.queue.put_nowait((path, image))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "avg_write_ms": round(self.write_time / self.written * 1000, 2) if self.written else 0.0,
+            }
+
+    def close(self):
+        """等队列里剩下的帧都写完再返回"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+    def _worker(self):
+        made_dirs = set()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, image = item
+
+            directory = os.path.dirname(path)
+            if directory and directory not in made_dirs:
+                os.makedirs(directory, exist_ok=True)
+                made_dirs.add(directory)
+
+            t0 = time.perf_counter()
+            ok = cv2.imwrite(path, image, self.params)
+            elapsed = time.perf_counter() - t0
+            with self.lock:
+                if ok:
+                    self.written += 1
+                    self.write_time += elapsed
+                else:
+                    self.failed += 1
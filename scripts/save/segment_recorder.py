@@ -0,0 +1,190 @@
+# segment_recorder.py
+'''
+分段录制格式：代替每帧一个 PNG + metadata_NNNN.json。
+
+一次录制是一个文件夹：
+    recording.json      每一路数据（rgb / depth）的 shape、dtype 和其它元数据
+    segment_00000.bin   帧数据按顺序追加，写满 segment_size 换下一个文件
+    segment_00001.bin
+    ...
+    index.bin           每帧一条定长记录：(stream, codec, segment, 帧号, 时间戳, offset, length)
+
+每帧的 offset 按 4096 对齐，raw 格式的帧可以直接在 mmap 上取 numpy view，随机访问任意一帧都不需要拷贝。
+depth 也可以用 depth_codec.py 里的编码压缩后再存（codecs={"depth": "delta-lz4"}），读的时候按 index 里的 codec 解码。
+index 每帧追加一条，采集中途断电时最后不完整的记录会被读取端忽略。
+'''
+import os
+import json
+import mmap
+import numpy as np
+from save.depth_codec import CODECS, encode_depth, decode_depth
+
+ALIGN = 4096
+
+INDEX_DTYPE = np.dtype([
+    ("stream",    "<u1"),
+    ("codec",     "<u1"),
+    ("segment",   "<u2"),
+    ("frame",     "<i8"),
+    ("timestamp", "<f8"),
+    ("offset",    "<i8"),
+    ("length",    "<i8"),
+])
+
+DEFAULT_STREAMS = {
+    "rgb":   ((480, 640, 3), np.uint8),
+    "depth": ((480, 640), np.uint16),
+}
+
+
+class SegmentWriter:
+    def __init__(self, root, streams=DEFAULT_STREAMS, segment_size=1 << 30, metadata=None,
+                 codecs=None, level=None):
+        """
+        :param root: 录制文件夹
+        :param streams: {名字: (shape, dtype)}
+        :param segment_size: 单个 segment 文件的大小上限（字节）
+        :param metadata: 写进 recording.json 的其它信息，比如 device_id、曝光、增益
+        :param codecs: 每一路数据的编码，例如 {"depth": "delta-lz4"}，没写的用 raw
+        :param level: 压缩级别，None 用每种编码的默认值
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root         = root
+        self.segment_size = segment_size
+        self.streams      = {}
+        for i, (name, (shape, dtype)) in enumerate(streams.items()):
+            codec = (codecs or {}).get(name, "raw")
+            if codec not in CODECS:
+                raise ValueError(f"unknown codec for {name}: {codec}")
+            self.streams[name] = {"id": i, "shape": list(shape), "dtype": np.dtype(dtype).str, "codec": codec}
+        self.level = level
+
+        with open(os.path.join(root, "recording.json"), "w") as f:
+            json.dump({"version": 1, "streams": self.streams, "metadata": metadata or {}}, f, indent=4)
+
+        # 同一个文件夹再录一次（比如 bag_ingest 重跑）时从头覆盖，旧的 segment 也删掉，
+        # 不然旧的索引记录会指到新写的数据上
+        for name in os.listdir(root):
+            if name.startswith("segment_") and name.endswith(".bin"):
+                os.remove(os.path.join(root, name))
+        self.index   = open(os.path.join(root, "index.bin"), "wb")
+        self.segment = -1
+        self.file    = None
+        self.offset  = 0
+        self._next_segment()
+
+    def _next_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.segment += 1
+        self.file   = open(os.path.join(self.root, f"segment_{self.segment:05}.bin"), "wb")
+        self.offset = 0
+
+    def write(self, stream, frame_index, timestamp, frame, codec=None):
+        """
+        追加一帧。frame 是 numpy 数组时按这一路的编码（或者 codec 参数）编码后写入；
+        已经编码好的 bytes 要同时给出 codec。
+        """
+        info  = self.streams[stream]
+        codec = codec or info["codec"]
+        if codec == "raw":
+            data = memoryview(np.ascontiguousarray(frame)).cast("B")
+        elif isinstance(frame, np.ndarray):
+            data = memoryview(encode_depth(frame, codec, self.level))
+        else:
+            data = memoryview(frame)
+
+        if self.offset > 0 and self.offset + len(data) > self.segment_size:
+            self._next_segment()
+
+        self.file.write(data)
+        record = np.array([(info["id"], CODECS.index(codec), self.segment, frame_index,
+                            timestamp, self.offset, len(data))], dtype=INDEX_DTYPE)
+        self.index.write(record.tobytes())
+
+        # 补齐到 4096 字节对齐，下一帧从新的一页开始
+        end = self.offset + len(data)
+        pad = -end % ALIGN
+        if pad:
+            self.file.write(b"\0" * pad)
+        self.offset = end + pad
+
+    def flush(self):
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class SegmentReader:
+    """
+    reader = SegmentReader("data/250122075706/20250714_2046")
+    depth  = reader.read("depth", 100)   # 第 100 帧 depth，mmap 上的 view
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, "recording.json")) as f:
+            info = json.load(f)
+        self.metadata = info["metadata"]
+        self.streams  = {name: (tuple(s["shape"]), np.dtype(s["dtype"])) for name, s in info["streams"].items()}
+        stream_ids    = {name: s["id"] for name, s in info["streams"].items()}
+
+        raw = np.fromfile(os.path.join(root, "index.bin"), dtype=np.uint8)
+        n   = len(raw) // INDEX_DTYPE.itemsize  # 忽略最后不完整的记录
+        index = raw[:n * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+
+        self._maps = [self._map(s) for s in range(int(index["segment"].max()) + 1 if n else 0)]
+        # 只保留数据完整写进 segment 文件的帧
+        sizes = np.array([len(m) if m is not None else 0 for m in self._maps], dtype=np.int64)
+        if n:
+            index = index[index["offset"] + index["length"] <= sizes[index["segment"]]]
+        self.index = {name: index[index["stream"] == sid] for name, sid in stream_ids.items()}
+
+    def _map(self, segment):
+        path = os.path.join(self.root, f"segment_{segment:05}.bin")
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return max((len(v) for v in self.index.values()), default=0)
+
+    def count(self, stream):
+        return len(self.index[stream])
+
+    def timestamps(self, stream):
+        return self.index[stream]["timestamp"]
+
+    def frame_numbers(self, stream):
+        return self.index[stream]["frame"]
+
+    def payload(self, stream, i):
+        """第 i 条记录的原始字节（memoryview，不拷贝）和它的 codec 名字"""
+        rec = self.index[stream][i]
+        m   = self._maps[rec["segment"]]
+        start = int(rec["offset"])
+        return memoryview(m)[start:start + int(rec["length"])], CODECS[rec["codec"]]
+
+    def read(self, stream, i):
+        """第 i 帧；raw 格式返回 mmap 上的只读 view，其它编码解码成新的数组"""
+        data, codec = self.payload(stream, i)
+        shape, dtype = self.streams[stream]
+        if codec == "raw":
+            return np.frombuffer(data, dtype=dtype).reshape(shape)
+        return decode_depth(data, shape, codec)
+
+    def frames(self, stream):
+        """按顺序遍历，返回 (帧号, 时间戳, 帧)"""
+        for i, rec in enumerate(self.index[stream]):
+            yield int(rec["frame"]), float(rec["timestamp"]), self.read(stream, i)
+
+    def close(self):
+        # 要先释放 read() 返回的 view，否则 mmap.close() 会报 BufferError
+        for m in self._maps:
+            if m is not None:
+                m.close()
+        self._maps = []
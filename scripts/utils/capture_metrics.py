@@ -0,0 +1,112 @@
+# capture_metrics.py
+import json
+import time
+import threading
+from multiprocessing import Array
+
+# 每个相机一块共享内存里的指标，采集进程写，主进程 / GUI 读（只有一个写的进程，不加锁）
+FIELDS = [
+    "frames",           # 采集到的帧数
+    "fps",              # 滑动平均帧率
+    "latency_ms",       # 相机时间戳到放进共享内存 / 队列的延迟（滑动平均）
+    "barrier_wait_ms",  # 每帧等 sync_barrier 的时间（滑动平均），自由采集时是 0
+    "camera_drops",     # 相机帧号跳过的帧（USB 带宽不够、主机没来得及取）
+    "queue_depth",      # 元数据队列里还没被消费者取走的帧数
+    "last_update",      # 最后一次更新的主机时间
+]
+_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+
+class CameraMetrics:
+    """
+    一个相机的采集指标。采集循环每帧调一次 frame()，只做几次浮点运算；
+    滑动平均用指数平均（alpha 越大越跟最新的帧），不保存历史。
+    """
+
+    def __init__(self, alpha=0.05):
+        self.alpha  = alpha
+        self.values = Array('d', len(FIELDS), lock=False)
+        self._last_time   = None
+        self._last_number = None
+
+    def frame(self, frame_number=None, latency_ms=0.0, barrier_wait_ms=0.0, queue_depth=0):
+        """
+        :param frame_number: 相机的帧号（color_frame.get_frame_number()），用来数相机那边丢的帧
+        """
+        v   = self.values
+        now = time.time()
+        a   = self.alpha
+
+        if self._last_time is not None:
+            dt = now - self._last_time
+            if dt > 0:
+                v[_INDEX["fps"]] = 1.0 / dt if v[_INDEX["fps"]] == 0 else (1 - a) * v[_INDEX["fps"]] + a / dt
+        self._last_time = now
+
+        if frame_number is not None:
+            if self._last_number is not None and frame_number > self._last_number + 1:
+                v[_INDEX["camera_drops"]] += frame_number - self._last_number - 1
+            self._last_number = frame_number
+
+        v[_INDEX["latency_ms"]]      = (1 - a) * v[_INDEX["latency_ms"]] + a * latency_ms
+        v[_INDEX["barrier_wait_ms"]] = (1 - a) * v[_INDEX["barrier_wait_ms"]] + a * barrier_wait_ms
+        v[_INDEX["queue_depth"]]     = queue_depth
+        v[_INDEX["frames"]]         += 1
+        v[_INDEX["last_update"]]     = now
+
+    def snapshot(self):
+        return {name: round(self.values[i], 2) for i, name in enumerate(FIELDS)}
+
+
+def metrics_snapshot(metrics, channels=None):
+    """
+    :param metrics: {device_id: CameraMetrics}
+    :param channels: {device_id: [SharedFrameChannel, ...]}，加上消费者跟不上丢掉的帧数
+    :return: {device_id: {指标名: 值}}
+    """
+    snapshot = {}
+    for device_id, m in metrics.items():
+        s = m.snapshot()
+        s["consumer_drops"] = sum(c.dropped.value for c in (channels or {}).get(device_id, []))
+        s["stale"] = s["last_update"] > 0 and time.time() - s["last_update"] > 2.0  # 2 秒没有新帧
+        snapshot[device_id] = s
+    return snapshot
+
+
+class MetricsReporter:
+    """
+    后台线程，每 interval 秒取一次所有相机的指标：
+      写一行 JSON 到 path（JSON Lines，方便事后用 pandas.read_json(lines=True) 看一整天的丢帧情况）
+      调 callback(snapshot)，给 GUI 显示
+    """
+
+    def __init__(self, metrics, path="capture_metrics.jsonl", interval=1.0, callback=None, channels=None):
+        self.metrics  = metrics
+        self.channels = channels
+        self.path     = path
+        self.interval = interval
+        self.callback = callback
+        self._stop    = threading.Event()
+        self._thread  = threading.Thread(target=self._run, name="MetricsReporter", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        f = open(self.path, "a") if self.path else None
+        try:
+            while not self._stop.wait(self.interval):
+                snapshot = metrics_snapshot(self.metrics, self.channels)
+                if f is not None:
+                    f.write(json.dumps({"time": round(time.time(), 3), "cameras": snapshot}) + "\n")
+                    f.flush()
+                if self.callback is not None:
+                    self.callback(snapshot)
+        finally:
+            if f is not None:
+                f.close()
@@ -0,0 +1,126 @@
+# depth_utils.py
+import os
+import json
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+def valid_mask(depth, min_depth=1, max_depth=5500):
+    """
+    min_depth <= depth <= max_depth 并且 depth 不是 0 的像素为 True，直接在 uint16 上比较，不转浮点。
+    depth 和阈值都是 z16 的原始单位（D4xx 是毫米）。
+    一次减法一次比较：(depth - lo) 在 uint16 上会回绕，小于 lo 的值变成很大的数，自然落在窗口外面。
+    """
+    lo = np.uint16(max(int(min_depth), 1))
+    hi = np.uint16(min(int(max_depth), 65535))
+    if hi < lo:
+        return np.zeros(depth.shape, dtype=bool)
+    return np.less_equal(depth - lo, np.uint16(hi - lo))
+
+
+# 一个字节里 1 的个数，np.bitwise_count 只有 numpy 2 才有
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class DepthValidity:
+    """
+    一帧的深度有效位图，每个像素 1 bit（np.packbits 按行打包），640x480 一帧 37.5 KB，
+    是 uint16 深度图的 1/16、float64 的 1/64。算一次，后面的 nonblack ratio、ROI 判断、树干过滤都直接用，
+    不用再读 depth PNG：
+
+        validity = DepthValidity.from_depth(depth_image, min_depth=1, max_depth=5500)
+        profile  = NonblackProfile(validity.band(92, 177))      # roi_ratio.py，bool 图也可以
+        ratio    = validity.ratio(92, 197, 177, 65)
+    """
+
+    def __init__(self, bits, shape, min_depth=1, max_depth=5500):
+        """
+        :param bits: (H, ceil(W/8)) uint8，np.packbits(mask, axis=1)
+        :param shape: (H, W)
+        """
+        self.bits      = bits
+        self.shape     = tuple(shape)
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_depth(cls, depth, min_depth=1, max_depth=5500):
+        return cls(np.packbits(valid_mask(depth, min_depth, max_depth), axis=1), depth.shape[:2], min_depth, max_depth)
+
+    def band(self, x=0, w=None):
+        """列带 [x, x+w) 的 bool 图（只解包这几列覆盖的字节）"""
+        width = self.shape[1]
+        x0 = min(max(x, 0), width)
+        x1 = width if w is None else min(x + w, width)
+        b0 = x0 // 8
+        mask = np.unpackbits(self.bits[:, b0:(x1 + 7) // 8], axis=1)
+        return mask[:, x0 - 8 * b0:x1 - 8 * b0].view(bool)
+
+    def mask(self):
+        """整帧的 bool 图"""
+        return self.band()
+
+    def count(self):
+        """有效像素数（打包的行末尾补的是 0，不影响计数）"""
+        return int(_POPCOUNT[self.bits].sum(dtype=np.int64))
+
+    def ratio(self, x, y, w, h):
+        """ROI [x, x+w) x [y, y+h) 里有效像素的比例，ROI 超出图像时按截断后的面积算"""
+        roi = self.band(x, w)[max(y, 0):y + h]
+        return float(np.count_nonzero(roi)) / roi.size if roi.size else 0.0
+
+
+def build_validity(depth_dir, output_path, min_depth=1, max_depth=5500, readers=4):
+    """
+    把一个文件夹的 depth PNG 读一遍，所有帧的位图存成 output_path.npy（(N, H, ceil(W/8)) uint8），
+    文件名和参数存在 output_path.json。之后用 ValidityStore 按文件名取，不再读 depth PNG。
+    """
+    names = sorted(f for f in os.listdir(depth_dir) if f.endswith(".png"))
+    if not names:
+        raise FileNotFoundError(f"no depth PNG in {depth_dir}")
+
+    bits = None
+    with ThreadPoolExecutor(max_workers=readers) as pool:  # cv2.imread 解码时不占 GIL
+        depths = pool.map(lambda n: cv2.imread(os.path.join(depth_dir, n), cv2.IMREAD_UNCHANGED), names)
+        for i, (name, depth) in enumerate(zip(names, depths)):
+            if depth is None:
+                raise IOError(f"cannot read {os.path.join(depth_dir, name)}")
+            if bits is None:  # 第一帧出来才知道分辨率
+                shape = depth.shape[:2]
+                bits = np.lib.format.open_memmap(output_path + ".npy", mode="w+", dtype=np.uint8,
+                                                 shape=(len(names), shape[0], (shape[1] + 7) // 8))
+            bits[i] = np.packbits(valid_mask(depth, min_depth, max_depth), axis=1)
+    bits.flush()
+
+    with open(output_path + ".json", "w") as f:
+        json.dump({"names": names, "shape": list(shape), "min_depth": min_depth, "max_depth": max_depth}, f)
+    return ValidityStore(output_path)
+
+
+class ValidityStore:
+    """
+    build_validity() 的结果，位图用 mmap 读，只有用到的帧才会从磁盘读进来。
+        store = ValidityStore("data/250122075706/20250714_2046/depth_valid")
+        validity = store["000123_depth.png"]   # 或者 store[123]
+    """
+
+    def __init__(self, path):
+        with open(path + ".json") as f:
+            info = json.load(f)
+        self.names     = info["names"]
+        self.shape     = tuple(info["shape"])
+        self.min_depth = info["min_depth"]
+        self.max_depth = info["max_depth"]
+        self.bits      = np.load(path + ".npy", mmap_mode="r")
+        self._index    = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, key):
+        i = self._index[key] if isinstance(key, str) else key
+        return DepthValidity(self.bits[i], self.shape, self.min_depth, self.max_depth)
@@ -0,0 +1,90 @@
+# frame_matcher.py
+import collections
+import numpy as np
+
+
+class FrameMatcher:
+    """
+    多相机按时间戳配对。每个相机自由采集，不再用 Barrier 逐帧同步，
+    消费者把每个相机收到的帧 add() 进来，时间戳相差不超过 tolerance 的一组帧作为一次匹配返回。
+
+    每个相机的帧按时间戳递增到达。每次看各相机最早的一帧：
+      最大和最小时间戳相差 <= tolerance  ->  这一组匹配，全部取出
+      否则最早的那一帧不可能再和别的相机匹配（别的相机后面的帧只会更晚），丢掉并计入 unmatched
+    """
+
+    def __init__(self, n_cameras, tolerance=1 / 60, max_pending=30):
+        """
+        :param n_cameras: 相机数量
+        :param tolerance: 同一组帧允许的最大时间差（秒），默认半帧（30 fps）
+        :param max_pending: 每个相机最多缓存多少帧还没配上的帧，某个相机断流时防止别的相机无限堆积
+        """
+        self.n_cameras   = n_cameras
+        self.tolerance   = tolerance
+        self.max_pending = max_pending
+        self.pending     = [collections.deque() for _ in range(n_cameras)]
+        self.matched     = 0
+        self.unmatched   = [0] * n_cameras
+
+    def add(self, camera, index, timestamp, payload=None):
+        """
+        :param camera: 相机编号 0..n_cameras-1
+        :param index: 帧号
+        :param timestamp: 时间戳（秒），所有相机要在同一个时钟上（global time 或主机时间）
+        :param payload: 和这一帧一起返回的东西，比如共享内存的槽位号
+        :return: 新配好的组的列表，每组是 [(index, timestamp, payload), ...]，按相机顺序
+        """
+        queue = self.pending[camera]
+        queue.append((index, timestamp, payload))
+        if len(queue) > self.max_pending:
+            queue.popleft()
+            self.unmatched[camera] += 1
+        return self._match()
+
+    def _match(self):
+        groups = []
+        while all(self.pending):
+            heads = [q[0][1] for q in self.pending]
+            earliest = int(np.argmin(heads))
+            if max(heads) - heads[earliest] <= self.tolerance:
+                groups.append([q.popleft() for q in self.pending])
+                self.matched += 1
+            else:
+                self.pending[earliest].popleft()
+                self.unmatched[earliest] += 1
+        return groups
+
+    def stats(self):
+        return {
+            "matched": self.matched,
+            "unmatched": list(self.unmatched),
+            "pending": [len(q) for q in self.pending],
+        }
+
+
+def match_timestamps(timestamps, tolerance=1 / 60):
+    """
+    录制完之后离线配对（例如 SegmentReader.timestamps() 读出来的每个相机的时间戳）。
+    以第一个相机为参考，在其它相机里找时间最近的一帧，所有相机都在 tolerance 之内才算一组。
+
+    :param timestamps: [相机 0 的时间戳数组, 相机 1 的时间戳数组, ...]，每个都是递增的
+    :return: (M, n_cameras) 的下标数组，每一行是一组匹配的帧在各自相机里的下标
+    """
+    ref = np.asarray(timestamps[0], dtype=np.float64)
+    columns = [np.arange(len(ref))]
+    ok = np.ones(len(ref), dtype=bool)
+    for ts in timestamps[1:]:
+        ts = np.asarray(ts, dtype=np.float64)
+        if len(ts) == 0:
+            return np.empty((0, len(timestamps)), dtype=np.int64)
+        right = np.clip(np.searchsorted(ts, ref), 1, len(ts) - 1) if len(ts) > 1 else np.zeros(len(ref), dtype=np.int64)
+        left  = np.maximum(right - 1, 0)
+        nearest = np.where(np.abs(ts[left] - ref) <= np.abs(ts[right] - ref), left, right)
+        ok &= np.abs(ts[nearest] - ref) <= tolerance
+        columns.append(nearest)
+    pairs = np.stack(columns, axis=1)[ok]
+    # 其它相机的同一帧只能用一次
+    for c in range(1, pairs.shape[1]):
+        _, first = np.unique(pairs[:, c], return_index=True)
+        pairs = pairs[np.sort(first)]
+    return pairs
@@ -0,0 +1,84 @@
+# image_utils.py
+import cv2
+import numpy as np
+from utils.depth_utils import valid_mask
+
+
+class DepthMaskFilter:
+    """
+    RGB 预处理：深度截断 + 水平翻转 + 裁剪，一次遍历做完（原来是 RGB_filter.py 读一遍写一遍、flip.py 再读一遍写一遍）。
+
+      深度为 0（没有深度）或者大于 max_depth 米的像素涂黑，和 RGB_filter.process_images 的结果一样；
+      阈值事先换算成 z16 的原始单位，每帧直接比较整数，不转成浮点的米。
+      裁剪是切片（view），不拷贝；掩码和翻转用 OpenCV 做（640x480 一帧不到 0.5 ms，numpy 的 multiply/where 要 5 ms 左右）。
+
+    采集时：  f = DepthMaskFilter(max_depth=5.5, flip=True)
+              out = f(rgb_image, depth_image)               # depth 要是对齐到 RGB 的
+    批处理：  见 RGB_filter.py
+    """
+
+    def __init__(self, max_depth=5.5, depth_scale=0.001, flip=True, crop=None):
+        """
+        :param max_depth: 深度截断（米），None 表示不做深度掩码
+        :param depth_scale: z16 一个单位是多少米，D4xx 一般是 0.001
+        :param flip: True 时水平翻转（cv2.flip(img, 1)）
+        :param crop: (x, y, w, h)，在原图（翻转之前）的坐标里裁剪，None 表示不裁剪
+        """
+        self.max_depth   = max_depth
+        self.depth_scale = depth_scale
+        self.flip        = flip
+        self.crop        = crop
+        # 0 < depth <= limit 的像素保留，见 utils/depth_utils.valid_mask
+        self.limit = None if max_depth is None else np.uint16(min(int(round(max_depth / depth_scale)), 65535))
+
+    def transform(self, image):
+        """只做裁剪和翻转，返回 view。depth 也用这个，保持和输出的 RGB 逐像素对应"""
+        image = self._crop(image)
+        if self.flip:
+            image = image[:, ::-1]
+        return image
+
+    def _crop(self, image):
+        if self.crop is None:
+            return image
+        x, y, w, h = self.crop
+        return image[y:y + h, x:x + w]
+
+    def output_shape(self, shape):
+        """输入图像 shape 对应的输出 shape"""
+        if self.crop is None:
+            return tuple(shape)
+        x, y, w, h = self.crop
+        return (max(0, min(h, shape[0] - y)), max(0, min(w, shape[1] - x))) + tuple(shape[2:])
+
+    def _mask(self, depth):
+        # 保留的像素是 1，只裁剪不翻转
+        return valid_mask(self._crop(depth), 1, self.limit).view(np.uint8)
+
+    def mask(self, depth):
+        """保留的像素为 True（已经裁剪和翻转）"""
+        mask = self._mask(depth).view(bool)
+        return mask[:, ::-1] if self.flip else mask
+
+    def __call__(self, rgb, depth=None, out=None):
+        """
+        :param rgb: (H, W, 3) uint8
+        :param depth: (H, W) uint16，和 rgb 对齐；max_depth 为 None 时可以不给
+        :param out: 预先分配的输出，形状是 output_shape(rgb.shape)；采集时每帧复用同一块，不给就新建
+        :return: 处理后的图像（给了 out 就是 out）
+        """
+        src = self._crop(rgb)
+        if self.limit is not None:
+            # 新分配的输出里掩码外的像素是 0
+            src = cv2.copyTo(src, self._mask(depth))
+        if self.flip:
+            return cv2.flip(src, 1, dst=out)
+        if out is None:
+            return src if self.limit is not None else src.copy()
+        np.copyto(out, src)
+        return out
+
+    def params(self):
+        """写进录制文件 metadata 的参数"""
+        return {"max_depth": self.max_depth, "depth_scale": self.depth_scale,
+                "flip": self.flip, "crop": None if self.crop is None else list(self.crop)}
@@ -1,11 +1,19 @@
+import os
+import time
+import queue
+import atexit
 import logging
+import threading
+import multiprocessing.util
+from logging.handlers import QueueHandler, QueueListener
 
 class LoggerManager:
-    def __init__(self, name=__name__, level=logging.DEBUG):
+    def __init__(self, name=__name__, level=logging.INFO, use_queue=True):
         """
         初始化 Logger
         :param name: 日志名称（默认使用 __name__）
-        :param level: 日志级别（默认 DEBUG）
+        :param level: 日志级别（默认 INFO；DEBUG 会输出采集循环里每一帧的日志）
+        :param use_queue: True 时日志先放进队列，由后台线程写到控制台，采集循环不会被控制台输出阻塞
         """
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
@@ -24,12 +32,108 @@ class LoggerManager:
             console_handler.setFormatter(formatter)
 
             # 添加处理器到 Logger
-            self.logger.addHandler(console_handler)
+            if use_queue:
+                self.logger.addHandler(_queue_handler(console_handler))
+            else:
+                self.logger.addHandler(console_handler)
 
     def get_logger(self):
         """返回 Logger 实例"""
         return self.logger
 
+
+_listeners = []  # [(QueueHandler, QueueListener)]，每个进程自己的后台线程
+
+
+def _queue_handler(handler):
+    """
+    返回一个 QueueHandler：logger.info() 只是把 record 放进队列（不等控制台 I/O），
+    后台的 QueueListener 线程再交给 handler 输出。
+    """
+    q = queue.SimpleQueue()
+    queue_handler = QueueHandler(q)
+    listener = QueueListener(q, handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append((queue_handler, listener))
+    return queue_handler
+
+
+def _restart_listeners():
+    # fork 出来的子进程里没有父进程的 listener 线程，不重启的话日志会一直堆在队列里
+    for i, (queue_handler, listener) in enumerate(_listeners):
+        q = queue.SimpleQueue()
+        queue_handler.queue = q
+        new_listener = QueueListener(q, *listener.handlers, respect_handler_level=True)
+        new_listener.start()
+        _listeners[i] = (queue_handler, new_listener)
+
+
+def _stop_listeners():
+    # 退出前把队列里剩下的日志写完
+    for _, listener in _listeners:
+        try:
+            listener.stop()
+        except Exception:
+            pass
+
+
+def _register_exit():
+    # multiprocessing 的子进程退出时不跑 atexit，要用 multiprocessing 的 Finalize
+    multiprocessing.util.Finalize(None, _stop_listeners, exitpriority=0)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listeners)
+atexit.register(_stop_listeners)
+_register_exit()
+# fork 的子进程启动时 multiprocessing 会清掉 Finalize，要在它的 after-fork 回调里重新注册
+multiprocessing.util.register_after_fork(_register_exit, lambda register: register())
+
+
+class RateLimitedLogger:
+    """
+    采集循环里用的 logger：同一条消息（按 level 和消息模板区分）interval 秒内最多输出一次，
+    被压掉的条数在下一次输出时附在后面。消息用 %s 参数，不要用 f-string，
+    这样被压掉或者级别不够的消息不会做格式化。
+
+        hot_logger = RateLimitedLogger(logger, interval=5.0)
+        hot_logger.warning("Barrier timeout for device %s: %s", device_id, e)
+    """
+
+    def __init__(self, logger, interval=1.0):
+        self.logger   = logger
+        self.interval = interval
+        self._last    = {}
+        self._lock    = threading.Lock()
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        key = (level, msg)
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return
+            self._last[key] = (now, 0)
+        if suppressed:
+            msg = f"{msg} (suppressed {suppressed} similar messages)"
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
 if __name__ == "__main__":
     logger = LoggerManager().get_logger()
-    logger.info("Logger 正常工作")
\ No newline at end of file
+    logger.info("Logger 正常工作")
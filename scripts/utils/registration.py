@@ -0,0 +1,130 @@
+# registration.py
+import numpy as np
+
+
+class Registration:
+    """
+    depth -> RGB 的配准表，代替每一帧都调 rs.align(rs.stream.color).process()。
+
+    深度图每个像素 (u, v) 的方向 ray = ((u-ppx)/fx, (v-ppy)/fy, 1) 是固定的，
+    转到 RGB 相机坐标系后 P = z * (R @ ray) + t，所以 R @ ray 可以事先算好，
+    每帧只剩下乘加、除法、取整和 scatter，全部是 numpy 向量运算。
+    和 rs.align 一样，每个深度像素的左上角和右下角都投影到 RGB，铺满中间的矩形
+    （RGB 的 fx 比深度大，只投影像素中心的话会有很多空洞）；
+    多个深度像素落到同一个 RGB 像素时取最近的那个，输出的是原来的深度值。
+
+    只用针孔模型，不考虑畸变（D4xx 的深度相机没有畸变，RGB 的畸变系数一般也都是 0）。
+
+    在线：  reg = Registration.from_profile(pipeline.get_active_profile())
+            aligned = reg.align(np.asanyarray(depth_frame.get_data()))
+    离线：  采集时 reg.save("registration_<device>.npz")，后处理时 Registration.load() 再 align。
+    """
+
+    def __init__(self, depth_intrinsics, color_intrinsics, rotation, translation, depth_scale):
+        """
+        :param depth_intrinsics / color_intrinsics: {"width", "height", "fx", "fy", "ppx", "ppy"}
+        :param rotation: depth -> color 的 3x3 旋转矩阵（行优先）
+        :param translation: depth -> color 的平移（米）
+        :param depth_scale: 深度单位（米），D4xx 一般是 0.001
+        """
+        self.depth_intrinsics = _intrinsics(depth_intrinsics)
+        self.color_intrinsics = _intrinsics(color_intrinsics)
+        self.rotation    = np.asarray(rotation, dtype=np.float64).reshape(3, 3)
+        self.translation = np.asarray(translation, dtype=np.float64).reshape(3)
+        self.depth_scale = float(depth_scale)
+
+        # 深度像素左上角和右下角的方向，乘上深度值就是 RGB 坐标系下的点（米），depth_scale 一起乘进去
+        self.rays = [self._rays(-0.5), self._rays(0.5)]
+
+    def _rays(self, offset):
+        d = self.depth_intrinsics
+        u, v = np.meshgrid(np.arange(d["width"]) + offset, np.arange(d["height"]) + offset)
+        rays = np.stack([(u - d["ppx"]) / d["fx"], (v - d["ppy"]) / d["fy"], np.ones(u.shape)], axis=-1)
+        # 存成 (3, H*W)，每个分量是连续的一行，每帧直接整行乘深度，不用 gather
+        return np.ascontiguousarray((rays.reshape(-1, 3) @ self.rotation.T * self.depth_scale).T, dtype=np.float32)
+
+    def __getstate__(self):
+        # 进程之间传递时只传内参外参（几百字节），rays 在对方进程里重新算
+        return {"depth_intrinsics": self.depth_intrinsics, "color_intrinsics": self.color_intrinsics,
+                "rotation": self.rotation, "translation": self.translation, "depth_scale": self.depth_scale}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @classmethod
+    def from_profile(cls, profile):
+        """从 pipeline.get_active_profile() 读内参、外参和深度单位"""
+        import pyrealsense2 as rs
+
+        depth_stream = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+        color_stream = profile.get_stream(rs.stream.color).as_video_stream_profile()
+        extrinsics   = depth_stream.get_extrinsics_to(color_stream)
+        depth_scale  = profile.get_device().first_depth_sensor().get_depth_scale()
+
+        def intrinsics(stream):
+            i = stream.get_intrinsics()
+            return {"width": i.width, "height": i.height, "fx": i.fx, "fy": i.fy, "ppx": i.ppx, "ppy": i.ppy}
+
+        # librealsense 的 rotation 是按列存的
+        rotation = np.asarray(extrinsics.rotation, dtype=np.float64).reshape(3, 3).T
+        return cls(intrinsics(depth_stream), intrinsics(color_stream), rotation, extrinsics.translation, depth_scale)
+
+    def save(self, path):
+        np.savez(path,
+                 depth_intrinsics=[self.depth_intrinsics[k] for k in _KEYS],
+                 color_intrinsics=[self.color_intrinsics[k] for k in _KEYS],
+                 rotation=self.rotation, translation=self.translation, depth_scale=self.depth_scale)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(dict(zip(_KEYS, data["depth_intrinsics"].tolist())),
+                   dict(zip(_KEYS, data["color_intrinsics"].tolist())),
+                   data["rotation"], data["translation"], float(data["depth_scale"]))
+
+    def align(self, depth):
+        """
+        :param depth: (H, W) uint16，深度相机分辨率的原始深度图
+        :return: RGB 分辨率的 uint16 深度图，没有深度的像素是 0
+        """
+        c = self.color_intrinsics
+        z  = np.ascontiguousarray(depth, dtype=np.uint16).reshape(-1)
+        zf = z.astype(np.float32)
+        t  = self.translation.astype(np.float32)
+
+        corners = []
+        with np.errstate(divide="ignore", invalid="ignore"):  # 深度为 0 的像素最后会被去掉
+            for rays in self.rays:
+                px = rays[0] * zf + t[0]
+                py = rays[1] * zf + t[1]
+                pz = rays[2] * zf + t[2]
+                # 和 librealsense 一样四舍五入到像素
+                x = np.floor(px / pz * c["fx"] + c["ppx"] + 0.5)
+                y = np.floor(py / pz * c["fy"] + c["ppy"] + 0.5)
+                corners.append((x, y))
+        (x0, y0), (x1, y1) = corners
+        # 没有深度的像素，以及矩形有一部分在 RGB 图外面的像素直接跳过（rs.align 也是这样）
+        keep = (z > 0) & (x0 >= 0) & (y0 >= 0) & (x1 < c["width"]) & (y1 < c["height"]) & (x0 <= x1) & (y0 <= y1)
+        x0, y0, x1, y1 = (a[keep].astype(np.int64) for a in (x0, y0, x1, y1))
+        zv = z[keep]
+
+        empty = np.iinfo(np.uint16).max
+        aligned = np.full(c["width"] * c["height"], empty, dtype=np.uint16)
+        if len(zv):
+            # 矩形一般只有 1~2 个像素宽，按矩形里的偏移分几次 scatter；
+            # 超出矩形的偏移夹到矩形边上，重复写同一个像素同一个深度值不影响结果，省掉每次的掩码
+            for dy in range(int((y1 - y0).max()) + 1):
+                rows = np.minimum(y0 + dy, y1) * c["width"]
+                for dx in range(int((x1 - x0).max()) + 1):
+                    np.minimum.at(aligned, rows + np.minimum(x0 + dx, x1), zv)
+        aligned[aligned == empty] = 0
+        return aligned.reshape(c["height"], c["width"])
+
+
+_KEYS = ["width", "height", "fx", "fy", "ppx", "ppy"]
+
+
+def _intrinsics(intrinsics):
+    i = {k: float(intrinsics[k]) for k in _KEYS}
+    i["width"], i["height"] = int(i["width"]), int(i["height"])
+    return i
@@ -0,0 +1,166 @@
+# shared_frames.py
+import queue
+import numpy as np
+from multiprocessing import Queue, Value, shared_memory
+
+
+class SharedFrameRing:
+    """
+    固定槽位的共享内存环形缓冲区，每个相机每种数据（RGB / depth）一个。
+    第 index 帧写到 index % slots 号槽位，消费者直接在共享内存上读，不需要 pickle 和多次拷贝。
+    每个槽位有一个序号，写之前置 -1，写完再写入帧号，消费者用它判断这一帧有没有被新帧覆盖。
+    """
+
+    def __init__(self, shape, dtype, slots=30, name=None, create=True):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+
+        header = slots * 8  # 每个槽位一个 int64 帧号
+        size   = header + slots * int(np.prod(self.shape)) * self.dtype.itemsize
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = _attach(name)
+
+        self.seq    = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf, offset=header)
+        if create:
+            self.seq[:] = -1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, index, frame):
+        """把一帧拷进槽位（唯一的一次拷贝），返回槽位号"""
+        slot = index % self.slots
+        self.seq[slot] = -1
+        self.frames[slot] = frame
+        self.seq[slot] = index
+        return slot
+
+    def read(self, slot, index):
+        """返回槽位里的帧（共享内存的 view，不拷贝）；如果已经被覆盖，返回 None"""
+        if self.seq[slot] != index:
+            return None
+        return self.frames[slot]
+
+    def is_current(self, slot, index):
+        """用完 view 之后再检查一次，确认处理期间没有被生产者覆盖"""
+        return self.seq[slot] == index
+
+    def latest(self):
+        """
+        最新写完的一帧，返回 (帧号, 槽位号, view)，还没有帧时返回 None。
+        不经过元数据队列，GUI 预览这种只要最新一帧的读者可以随便加，不会和消费者抢帧。
+        """
+        slot  = int(np.argmax(self.seq))
+        index = int(self.seq[slot])
+        if index < 0:
+            return None
+        return index, slot, self.frames[slot]
+
+    def close(self):
+        # 先释放 numpy 对共享内存的引用，否则 close 会报 BufferError
+        self.seq = None
+        self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def __getstate__(self):
+        # spawn 启动子进程时只传共享内存的名字，子进程里重新 attach
+        return {"name": self.name, "shape": self.shape, "dtype": self.dtype.str, "slots": self.slots}
+
+    def __setstate__(self, state):
+        self.__init__(state["shape"], state["dtype"], state["slots"], name=state["name"], create=False)
+
+
+def _attach(name):
+    try:
+        # Python 3.13+：attach 的进程不注册到 resource_tracker，避免退出时把共享内存删掉
+        return shared_memory.SharedMemory(name=name, create=False, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name, create=False)
+
+
+class SharedFrameChannel:
+    """
+    一个相机一路数据的传输通道：帧放在 SharedFrameRing 里，
+    只有 (帧号, 时间戳, 槽位号) 这样的小元数据走 multiprocessing.Queue。
+    元数据队列满了就丢掉这条消息（对应的槽位迟早会被覆盖），并计入 dropped。
+    消费者用 attach() / detach() 登记，没有消费者的时候（比如只有 GUI 预览，它用 ring.latest()）
+    元数据不进队列，也不算丢帧。
+    """
+
+    def __init__(self, shape, dtype, slots=30):
+        self.ring      = SharedFrameRing(shape, dtype, slots)
+        self.meta      = Queue(maxsize=slots)
+        self.dropped   = Value('i', 0)  # 消费者跟不上而丢掉的帧数
+        self.consumers = Value('i', 0)  # 登记了的消费者个数
+
+    def attach(self):
+        """消费者开始 receive() 之前调用"""
+        with self.consumers.get_lock():
+            self.consumers.value += 1
+
+    def detach(self):
+        """消费者退出时调用；最后一个消费者走了以后把队列里剩下的元数据清掉，下一个消费者不会拿到旧帧"""
+        with self.consumers.get_lock():
+            self.consumers.value -= 1
+            if self.consumers.value > 0:
+                return
+        while True:
+            try:
+                self.meta.get_nowait()
+            except queue.Empty:
+                break
+
+    def publish(self, index, timestamp, frame):
+        slot = self.ring.write(index, frame)
+        if self.consumers.value <= 0:
+            return slot
+        try:
+            self.meta.put_nowait((index, timestamp, slot))
+        except queue.Full:
+            with self.dropped.get_lock():
+                self.dropped.value += 1
+        return slot
+
+    def receive(self, timeout=None):
+        """
+        取下一帧，返回 (帧号, 时间戳, 槽位号, 帧的 view)；timeout 内没有新帧返回 None。
+        timeout 和 Queue.get 一样：None 一直等到有帧，0 不等（轮询用）。
+        已经被覆盖的帧直接跳过并计入 dropped。
+        """
+        while True:
+            try:
+                if timeout == 0:
+                    index, timestamp, slot = self.meta.get_nowait()
+                else:
+                    index, timestamp, slot = self.meta.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+            frame = self.ring.read(slot, index)
+            if frame is not None:
+                return index, timestamp, slot, frame
+            with self.dropped.get_lock():
+                self.dropped.value += 1
+
+    def is_current(self, slot, index):
+        return self.ring.is_current(slot, index)
+
+    def qsize(self):
+        """元数据队列里还没被取走的帧数（macOS 上 Queue.qsize 不可用，返回 -1）"""
+        try:
+            return self.meta.qsize()
+        except NotImplementedError:
+            return -1
+
+    def close(self, unlink=False):
+        self.ring.close()
+        if unlink:
+            self.ring.unlink()
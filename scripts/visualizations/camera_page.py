@@ -57,6 +57,14 @@ class CameraPage(QWidget):
         self.camera_display.setStyleSheet("background-color: black;")
         self.camera_display.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         main_layout.addWidget(self.camera_display)
+
+        # 采集指标：当前选中相机的帧率、延迟、丢帧和队列深度，每秒刷新一次
+        self.metrics_label = QLabel("", self)
+        self.metrics_label.setStyleSheet("font-size: 14px; padding: 2px;")
+        main_layout.addWidget(self.metrics_label)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics)
+        self.metrics_timer.start(1000)
         
         # 下部参数设置区域
         bottom_layout = QHBoxLayout()
@@ -109,13 +117,36 @@ class CameraPage(QWidget):
         else:
             self.camera_display.setText("No frame received yet.")
 
+    def update_metrics(self):
+        """从 TaskManager 取采集指标，显示当前选中的相机；丢帧或者超过 2 秒没有新帧时标红"""
+        get_metrics = getattr(self.taskManager, "get_capture_metrics", None)
+        if get_metrics is None:
+            return
+        m = get_metrics().get(self.camera_select.currentText())
+        if not m:
+            self.metrics_label.setText("")
+            return
+        drops = int(m["camera_drops"] + m["consumer_drops"])
+        self.metrics_label.setText(
+            f"FPS: {m['fps']:.1f}   Latency: {m['latency_ms']:.1f} ms   Barrier wait: {m['barrier_wait_ms']:.1f} ms   "
+            f"Dropped: {drops}   Queue: {int(m['queue_depth'])}"
+        )
+        color = "red" if drops or m["stale"] else "black"
+        self.metrics_label.setStyleSheet(f"font-size: 14px; padding: 2px; color: {color};")
+
     def applyCameraSettings(self):
         """应用当前下拉框选中相机的设置，示例中只打印日志"""
         selected_cam = self.camera_select.currentText()
         exposure = self.exposure_input.text()
         gain = self.gain_input.text()
         logger.info(f"Applying settings for {selected_cam}: Exposure={exposure}, Gain={gain}")
-        # 此处可扩展，将参数传递给 TaskManager 或相机接口
+        update = getattr(self.taskManager, "update_camera_parameters", None)
+        if update is None:
+            return
+        try:
+            update(selected_cam, float(exposure), float(gain))
+        except ValueError:
+            logger.error(f"Invalid exposure or gain: {exposure}, {gain}")
 
     def handle_new_frame(self, device_id, qimg):
         """
@@ -32,13 +32,23 @@ class StartPage(QWidget):
     
     def handleDataCollection(self):
         """
-        开始数据采集的处理逻辑
-        你可以在这里添加启动数据采集相关的代码
+        开始 / 停止数据采集：正在录制时这个按钮是“Stop Data Collection”，只停录制，相机和预览不停
         """
+        if self.taskManager.is_collecting():
+            print("Stopping data collection...")
+            self.taskManager.stopDataCollection()
+            self.dataCollectionButton.setText("Start Data Collection")
+            QMessageBox.information(self, "Data Collection", "Data collection has been stopped!")
+            return
+
         print("Starting data collection...")
-        # 例如，弹出一个信息框
+        try:
+            self.taskManager.dataCollectTask()
+        except Exception as e:
+            QMessageBox.critical(self, "Data Collection", f"Failed to start data collection: {e}")
+            return
+        self.dataCollectionButton.setText("Stop Data Collection")
         QMessageBox.information(self, "Data Collection", "Data collection has been started!")
-        # self.taskManager.dataCollectTask()
     
     def handleRealTime(self):
         """
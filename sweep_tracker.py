@@ -0,0 +1,144 @@
+'''
+trunk tracker 的参数扫描：
+  1. 每一行先读一遍（检测结果走 DetectionCache，已经跑过 YOLO 的帧不会再推理），
+     把每帧的 (N,6) 检测框和非黑像素前缀和 NonblackProfile 存在内存里；
+  2. 对 y_gap / threshold_norm / area_threshold / ratio_threds / y_threshold 的每一种组合，
+     在进程池里重放 activetracking() + find_identity()，不再读图也不再推理；
+  3. 每种组合每一行数出来的树和人工数的 ground truth 比较，结果写成 CSV。
+'''
+import os
+import io
+import csv
+import glob
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from detector_session import DetectorSession
+from detection_cache import DetectionCache
+from roi_ratio import NonblackProfile
+from tree_counting_v2 import TreeCounter
+
+
+class ReplaySession:
+    """代替 DetectorSession，直接返回预先算好的检测框"""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def detect(self, image_path, frame=None):
+        return self.boxes[image_path]
+
+
+def load_row(row_dir, session, batch_size=8):
+    """
+    读一行的所有帧，返回 [(文件名, 检测框, NonblackProfile), ...]
+    """
+    paths = glob.glob(os.path.join(row_dir, "*.png"))
+    paths = sorted(paths, key=lambda p: int(os.path.splitext(os.path.basename(p))[0]))
+
+    frames = []
+    for p, frame in session.prefetch(paths, batch_size=batch_size):
+        frames.append((p, session.detect(p, frame), NonblackProfile(frame, x = 92, w = 177)))
+    return frames
+
+
+def replay_row(frames, params):
+    """
+    用一组参数重放一行，返回数出来的树的数量（有效帧不少于 5 帧才算一棵树，和 count_rows 一样）
+    """
+    boxes = {p: b for p, b, _ in frames}
+    counter = TreeCounter(ReplaySession(boxes), **params)
+
+    n_trees = 0
+    with contextlib.redirect_stdout(io.StringIO()):  # activetracking 每帧都会 print，扫描时不需要
+        for p, _, profile in frames:
+            event = counter.update(p, profile=profile)
+            if event and event["identity"] is not None:
+                n_trees += 1
+        event = counter.finish()
+        if event and event["identity"] is not None:
+            n_trees += 1
+    return n_trees
+
+
+_rows = None  # worker 进程里的预计算数据，进程启动时传进来一次
+
+
+def _init_worker(rows):
+    global _rows
+    _rows = rows
+
+
+def _run_combination(params):
+    return params, {row_dir: replay_row(frames, params) for row_dir, frames in _rows.items()}
+
+
+def param_grid(grid):
+    """{"y_gap": [0.2, 0.3], ...} -> [{"y_gap": 0.2, ...}, {"y_gap": 0.3, ...}]"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def sweep(row_dirs, ground_truth, grid, workers=None, weights="train3/weights/best.pt",
+          cache_db="detection_cache.db", output_file="sweep_result.csv"):
+    """
+    :param row_dirs: 行文件夹列表
+    :param ground_truth: {row_dir: 人工数的树的数量}
+    :param grid: 每个参数要扫描的取值，参数名和 TreeCounter 的一样
+    :return: 按总误差从小到大排好序的结果列表
+    """
+    combinations = param_grid(grid)
+    if not combinations:  # 某个参数给了空列表，一种组合都没有，先报错，不用白白读一遍所有帧
+        empty = [k for k, values in grid.items() if len(values) == 0]
+        raise ValueError(f"Parameter grid has no combinations, empty values for: {empty}")
+
+    session = DetectorSession(weights, cache=DetectionCache(cache_db))
+    rows = {}
+    for row_dir in row_dirs:
+        print(f"Loading {row_dir} ...")
+        rows[row_dir] = load_row(row_dir, session)
+
+    print(f"Replaying {len(combinations)} combinations over {len(rows)} rows")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rows,)) as pool:
+        for params, counts in pool.map(_run_combination, combinations):
+            errors = {r: counts[r] - ground_truth[r] for r in row_dirs if r in ground_truth}
+            results.append({
+                **params,
+                **{f"count:{os.path.basename(r.rstrip(os.sep))}": counts[r] for r in row_dirs},
+                "total_count": sum(counts.values()),
+                "total_abs_error": sum(abs(e) for e in errors.values()),
+            })
+
+    results.sort(key=lambda r: r["total_abs_error"])
+    with open(output_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Sweep result saved to {output_file}")
+    return results
+
+
+if __name__ == '__main__':
+
+    base = "/Volumes/LaCie/Agrosense2/data_2025_7_22/data"
+    row_dirs = [
+        os.path.join(base, "250122075706/20250714_2046/flipped_filtered55"),
+        os.path.join(base, "033422071163/20250714_2046/flipped_filtered55"),
+    ]
+    ground_truth = {  # 人工数的每一行的树（示例数字，换成实际数的结果）
+        row_dirs[0]: 52,
+        row_dirs[1]: 49,
+    }
+    grid = {
+        "y_gap": [0.2, 0.25, 0.3, 0.35],
+        "threshold_norm": [0.25, 0.3, 0.35],
+        "area_threshold": [0.003, 0.004, 0.005],
+        "ratio_threds": [0.1, 0.2, 0.3],
+        "y_threshold": [0.1, 0.15, 0.2],
+    }
+
+    results = sweep(row_dirs, ground_truth, grid)
+    print("best parameters:", results[0])
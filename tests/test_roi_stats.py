@@ -0,0 +1,71 @@
+import os
+import sys
+import csv
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from roi_nonblack_ratio import batch_roi_stats, columns
+from save.segment_recorder import SegmentWriter
+
+# 一个普通的 ROI、一个超出底部的、一个超出右边的，列带各不相同
+ROIS = {"mid": (10, 12, 20, 15), "bottom": (5, 40, 30, 20), "right": (50, 0, 30, 8)}
+HEIGHT, WIDTH = 48, 64
+FRAME_NUMBERS = [3, 4, 7, 8, 9, 15, 16]
+
+
+def _frames():
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (len(FRAME_NUMBERS), HEIGHT, WIDTH, 3), dtype=np.uint8)
+    frames[rng.random(frames.shape[:3]) < 0.4] = 0  # 一部分像素整个涂黑
+    frames[rng.random(frames.shape) < 0.2] = 0       # 一部分只有某个通道是 0，不算黑
+    return frames
+
+
+def _reference(frame):
+    """原来的算法：在整帧上切 ROI，np.all(roi == [0, 0, 0], axis=-1)"""
+    row = []
+    for x, y, w, h in ROIS.values():
+        roi = frame[y:y + h, x:x + w]
+        black = int(np.sum(np.all(roi == [0, 0, 0], axis=-1)))
+        total = roi.shape[0] * roi.shape[1]
+        row += [black, total - black, (total - black) / total]
+    return row
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        assert next(reader) == columns(ROIS)
+        # 比例是 repr 写出去的，float 读回来和原来的值完全一样
+        return [(r[0], [float(v) for v in r[1:]]) for r in reader]
+
+
+def test_png_and_segment_give_the_same_stats(tmp_path):
+    frames = _frames()
+
+    png_dir = tmp_path / "png"
+    png_dir.mkdir()
+    for n, frame in zip(FRAME_NUMBERS, frames):
+        cv2.imwrite(str(png_dir / f"{n:06d}.png"), frame)
+
+    segment_dir = tmp_path / "segments"
+    writer = SegmentWriter(str(segment_dir), streams={"rgb": ((HEIGHT, WIDTH, 3), np.uint8)})
+    for k, (n, frame) in enumerate(zip(FRAME_NUMBERS, frames)):
+        writer.write("rgb", n, float(k), frame)
+    writer.close()
+
+    png_csv, segment_csv = str(tmp_path / "png.csv"), str(tmp_path / "segments.csv")
+    assert batch_roi_stats(str(png_dir), png_csv, ROIS, workers=2, chunk_size=3) == len(FRAME_NUMBERS)
+    assert batch_roi_stats(str(segment_dir), segment_csv, ROIS, workers=2, chunk_size=3) == len(FRAME_NUMBERS)
+
+    png_rows, segment_rows = _read_csv(png_csv), _read_csv(segment_csv)
+    assert len(png_rows) == len(segment_rows) == len(FRAME_NUMBERS)
+    for n, frame, (png_key, png_stats), (segment_key, segment_stats) in zip(
+            FRAME_NUMBERS, frames, png_rows, segment_rows):
+        assert png_key == f"{n:06d}.png"
+        assert segment_key == str(n)
+        assert png_stats == _reference(frame)
+        assert segment_stats == _reference(frame)
@@ -1,56 +1,45 @@
-from ultralytics import YOLO
+from detector_session import DetectorSession, get_session
+from detection_cache import DetectionCache, file_hash
 from pathlib import Path
 import os
+import sys
 import glob
 import numpy as np
 import cv2
 import pandas as pd
+import queue
+import json
+import itertools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from roi_ratio import NonblackProfile
+from box_filter import same_row_keep
 
 
 def yolo_detection(image_path: str, weights: str = "train3/weights/best.pt",
                    project: str = "runs/detect", name: str = "predict5",
-                   iou: float = 0.1):
+                   iou: float = 0.1, session: DetectorSession = None):
 
-    model = YOLO(weights)
+    # 模型只加载一次：没有传入 session 时复用同参数的全局会话
+    if session is None:
+        session = get_session(weights, project, name, iou)
 
-    results = model(
-        image_path,
-        stream=True,
-        save=True,
-        save_txt=True,
-        save_conf=True,
-        iou=iou,
-        project=project,
-        name=name,
-        exist_ok=True
-    )
+    return session.label_path(image_path)
 
-    for _ in results:
-        break
 
-    # 构造标签文件的路径
-    img_stem = Path(image_path).stem
-    label_dir = Path(project) / name / "labels"
-    label_path = label_dir / f"{img_stem}.txt"
-
-    if not label_path.exists():  # 如果没有检测出物体，就不会自己生成txt文件，需要自己补齐一个
-        label_dir.mkdir(parents=True, exist_ok=True)  # 确保标签目录存在
-        label_path.write_text("")  # 创建空 txt 文件
-
-    return str(label_path)
-
-
-def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_threshold: float = 0.004):
+def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_threshold: float = 0.004,
+                      y_threshold: float = 0.15):
     """
     作用是去掉不相关的bounding box
-    读取并过滤一个 YOLO label 文件（每行：
+    读取并过滤一个 YOLO label 文件或 (N,6) 检测数组（每行：
       class x_center y_center width height [confidence]
     归一化到 0~1）。只保留符合“最左侧 + buffer + 最高置信度”规则的那一行。
     返回：保留的那一行（含 '\n'），或空列表（文件无内容）。
     """
-    # 读所有行
-
-    arr = np.loadtxt(label_path, ndmin=2)  # 确保返回 shape==(1,6) 或 (N,6)
+    # 读所有行。直接传入 (N,6) 数组时（DetectorSession.detect 的结果）就不用再读 txt 了
+    if isinstance(label_path, np.ndarray):
+        arr = label_path
+    else:
+        arr = np.loadtxt(label_path, ndmin=2)  # 确保返回 shape==(1,6) 或 (N,6)
 
     if arr.size == 0:
         return []
@@ -75,22 +64,7 @@ def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_thresho
     else:  # 如果还是有多个，就要保证同一水平线上（垂直于地面方向）只有一个bbx
         xc = candidates[:, 1]
         yc = candidates[:, 2]
-        y_threshold = 0.15
-        keep = np.ones(candidates.shape[0], dtype=bool)
-
-        for i in range(len(keep)):
-            if not keep[i]:
-                continue
-            for j in range(i+1, len(keep)):
-                if not keep[j]:
-                    continue
-                if abs(yc[i] - yc[j]) < y_threshold:
-                    # 同水平线，删掉 x 更大的 （更高的）
-                    if xc[i] < xc[j]:
-                        keep[j] = False
-                    else:
-                        keep[i] = False
-                        break
+        keep = same_row_keep(xc, yc, y_threshold)  # 同水平线，删掉 x 更大的 （更高的）
 
         candidates = candidates[keep]  # 肯定是大于等于1的
 
@@ -99,8 +73,8 @@ def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_thresho
 
 
 def nonblack_ratio(image_path, x, y, w, h):   # y central 默认197
-    # 提取 图片中间部分的ROI
-    img = cv2.imread(image_path)
+    # 提取 图片中间部分的ROI。已经解码好的帧可以直接传进来
+    img = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
     roi = img[y:y+h, x:x+w]
 
     # 判断黑色像素
@@ -113,20 +87,22 @@ def nonblack_ratio(image_path, x, y, w, h):   # y central 默认197
 
 
 
-def ratio_select_filter(image_path: str, candidates, ratio_threds):
-    filtered_box = []
+def ratio_select_filter(image_path, candidates, ratio_threds, profile: NonblackProfile = None):
+    """
+    image_path 可以是文件路径，也可以是已经解码好的帧；
+    也可以直接传入这一帧的 NonblackProfile，所有候选框的 ROI 比例一次算完，不再重复读图。
+    """
     if len(candidates) == 0:
-        return np.array(filtered_box)
-    else:
-        for i in range(len(candidates)):
-            y = candidates[i, 2]
-            H = cv2.imread(image_path).shape[0]  # 图像高度
-            y_pixel = int(y * H)
-            nonblack_ratio_box = nonblack_ratio(image_path, x = 92, y = y_pixel, w = 177, h = 65)
-            # print("filtered nonblack ratio ", nonblack_ratio_box)
-            if nonblack_ratio_box > ratio_threds:
-                filtered_box.append(candidates[i])
-    return np.array(filtered_box)
+        return np.array([])
+
+    if profile is None:
+        frame = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
+        profile = NonblackProfile(frame, x = 92, w = 177)
+
+    y_pixels = (candidates[:, 2] * profile.height).astype(int)  # 图像高度
+    nonblack_ratio_box = profile.ratios(y_pixels, h = 65)
+    # print("filtered nonblack ratio ", nonblack_ratio_box)
+    return candidates[nonblack_ratio_box > ratio_threds]
 
 
 def get_central(list):
@@ -136,12 +112,23 @@ def get_central(list):
 
 
 
-def activetracking(p, y_centers, ratios, activetrack, y_gap):
+def activetracking(p, y_centers, ratios, activetrack, y_gap, session=None, frame=None, profile=None,
+                   threshold_norm=0.3, area_threshold=0.004, ratio_threds=0.2, y_threshold=0.15):
     new_tree_flag = False  # 默认不是新树
 
-    txt  = yolo_detection(p)
-    line = filter_label_file(txt)
-    filtered_line = ratio_select_filter(p, line, ratio_threds = 0.2)
+    # 每帧只解码一次，检测、候选框和中间 ROI 的非黑比例都用同一帧
+    # 参数扫描时会直接传入缓存好的 profile，这时连图都不用读
+    if frame is None and profile is None:
+        frame = cv2.imread(p)
+
+    if session is None:
+        session = get_session()
+    boxes = session.detect(p, frame)  # 直接用内存里的检测框，不再写 txt 再读回来
+    line = filter_label_file(boxes, threshold_norm, area_threshold, y_threshold)
+
+    if profile is None:
+        profile = NonblackProfile(frame, x = 92, w = 177)
+    filtered_line = ratio_select_filter(frame, line, ratio_threds = ratio_threds, profile = profile)
     print("filtered_line", filtered_line)
 
     # ===== 之前的filter还不够彻底，在这里再重新联系前后帧再筛选一遍 ============
@@ -175,7 +162,7 @@ def activetracking(p, y_centers, ratios, activetrack, y_gap):
         y_centers.append([])
 
     # 保存图像中间非黑像素比
-    ratios.append(nonblack_ratio(p, x = 92, y = 197, w = 177, h = 65))
+    ratios.append(profile.ratio(y = 197, h = 65))
 
 # ===================以下是tracking===============================
 
@@ -225,76 +212,249 @@ def find_identity(activetrack):   # 如果atravtive list 足够长（包含空
         return middle
 
 
+class TreeCounter:
+    """
+    流式数树：一帧一帧地喂进来，每当一棵树结束就生成一个事件，不用等整个文件夹处理完。
+    内部还是调用 activetracking()，结果和原来的 __main__ 循环完全一样，
+    但内存是有上限的：只保留当前这棵树的有效帧，以及固定长度的 y_centers / ratios 历史窗口。
+
+    事件是一个 dict：
+      {"tree": 第几棵树, "frames": 这棵树占了多少帧（包括没检测到的帧）,
+       "track": 有效帧列表 [(y_center, 文件名, ratio), ...], "identity": find_identity 的结果}
+
+    给了 checkpoint 文件路径时，每处理 checkpoint_every 帧就把 tracker 的状态
+    （y_centers、ratios、activetrack、处理到第几帧、已经结束的树）写到这个 JSON 文件里。
+    同一个数据源再跑一次时，从上次的 checkpoint 接着跑：之前结束的树会先重新生成一遍（不带 track），
+    已经处理过的帧直接跳过，不再推理。
+    checkpoint 只在数据源（包括帧数和最后一帧）、模型（权重 hash + iou）和 tracker 参数都一样时才用；
+    处理完以后默认删掉，keep_checkpoint=True 时才保留（再跑一次直接得到结果）。
+    """
 
-
-
-
-
-if __name__ == '__main__':
-
-    # image_dir = "014/right/flipped_filtered_data_R14-55"
-    image_dir = "/Volumes/LaCie/Agrosense2/data_2025_7_22/data/250122075706/20250714_2046/flipped_filtered55"
-    # image_dir = "/Volumes/LaCie/Agrosense2/009/left/filtered_data_L009-55"
-    out_dir   = "detected_trunks"
-    os.makedirs(out_dir, exist_ok=True)
-
-    # 1. 按数字 filename 排序
-    paths = glob.glob(os.path.join(image_dir, "*.png"))
-    paths = sorted(paths, key=lambda p: int(os.path.splitext(os.path.basename(p))[0]))
-
-
-    # 2. 预计算 y_centers 和 ratios。ycenter因该是从大到小的，因为树是从图片的下方移动到上方
-
-    y_gap = 0.3 # 越大表示可以容忍的没检测到树干的间隙越大
-    y_centers = []
-    ratios = []
-    save_result = []
-    activetrack = []
-
-
-    for p in paths:  # p 就是对应的文件名
-
-        finished_tree = activetracking(p, y_centers, ratios, activetrack, y_gap)
-        if finished_tree:
-            print("Finished tree with", len(finished_tree), "frames:")
-            print(finished_tree)
-            identity_file = find_identity(finished_tree)
-            print("identity frame is:", identity_file)
-            save_result.append(identity_file)
-
-
-
-
-# 处理最后一棵树
-    if activetrack != 0:
+    def __init__(self, session: DetectorSession = None, y_gap: float = 0.3,
+                 history: int = 64, batch_size: int = 8,
+                 checkpoint: str = None, checkpoint_every: int = 500, keep_checkpoint: bool = False,
+                 threshold_norm: float = 0.3, area_threshold: float = 0.004,
+                 ratio_threds: float = 0.2, y_threshold: float = 0.15):
+        self.session    = session if session is not None else get_session()
+        self.y_gap      = y_gap
+        # 单帧过滤的参数，和 filter_label_file / ratio_select_filter 的含义一样
+        self.filter_params = {
+            "threshold_norm": threshold_norm,
+            "area_threshold": area_threshold,
+            "ratio_threds": ratio_threds,
+            "y_threshold": y_threshold,
+        }
+        self.history    = history       # y_centers / ratios 最多保留多少帧
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.keep_checkpoint  = keep_checkpoint
+
+        self.y_centers   = []
+        self.ratios      = []
+        self.activetrack = []
+        self.tree_index  = 0
+        self.track_frames = 0          # 当前这棵树已经经过的帧数
+        self.next_index  = 0           # 下一帧在数据源里的序号
+        self.source      = None        # 当前数据源（文件夹或 .bag），用来判断 checkpoint 是不是同一个
+        self.source_frames = None      # 数据源里有哪些帧（帧数和最后一帧，或者文件大小和修改时间）
+        self._model_key  = None
+        self.events      = []          # 已经结束的树（不带 track），只在开启 checkpoint 时记录
+
+    def update(self, p, frame=None, profile=None):
+        """处理一帧，如果这一帧让上一棵树结束了，返回那棵树的事件，否则返回 None"""
+        finished_tree = activetracking(p, self.y_centers, self.ratios, self.activetrack,
+                                       self.y_gap, self.session, frame, profile, **self.filter_params)
+        event = None
+        if finished_tree is not None:
+            event = self._event(finished_tree, self.track_frames)
+            self.track_frames = 0
+        self.track_frames += 1
+        self._trim()
+        return event
+
+    def finish(self):
+        """数据流结束时调用，处理最后一棵树"""
+        if not self.activetrack and self.track_frames == 0:
+            return None
         print("the last one")
-        finished_tree = activetrack.copy()
-        activetrack.clear()
-        print(finished_tree)
+        event = self._event(self.activetrack.copy(), self.track_frames)
+        self.activetrack.clear()
+        self.y_centers.clear()
+        self.ratios.clear()
+        self.track_frames = 0
+        return event
+
+    def count(self, frames, source=None):
+        """
+        frames 是 (key, frame) 的可迭代对象（frame 可以是 None，这时按 key 当文件路径读图），
+        逐个生成结束的树。source 不为空并且开启了 checkpoint 时可以断点续跑。
+        """
+        replay = self.resume(source)
+        frames = itertools.islice(frames, self.next_index, None)  # 已经处理过的帧直接跳过
+        return self._count(frames, replay)
+
+    def count_directory(self, image_dir):
+        paths = glob.glob(os.path.join(image_dir, "*.png"))
+        paths = sorted(paths, key=lambda p: int(os.path.splitext(os.path.basename(p))[0]))
+        last = os.path.basename(paths[-1]) if paths else None
+        replay = self.resume(image_dir, {"frame_count": len(paths), "last_frame": last})
+        frames = self.session.prefetch(paths[self.next_index:], batch_size=self.batch_size)
+        return self._count(frames, replay)
+
+    def count_bag(self, bag_file, depth_cutoff: int = 5500, flip: bool = True):
+        stat = os.stat(bag_file)
+        replay = self.resume(bag_file, {"size": stat.st_size, "mtime": stat.st_mtime})
+        frames = itertools.islice(bag_frames(bag_file, depth_cutoff, flip), self.next_index, None)
+        return self._count(self.session.prefetch_frames(frames, batch_size=self.batch_size), replay)
+
+    def count_queue(self, frame_queue, stop_event=None):
+        # 实时采集时不攒 batch，避免增加延迟
+        return self.count(queue_frames(frame_queue, stop_event))
+
+    def resume(self, source, source_frames=None):
+        """
+        如果 checkpoint 文件属于同一个数据源和同样的参数，就恢复 tracker 的状态，
+        返回之前已经结束的树；否则从头开始，返回空列表。
+        source_frames 描述数据源里的帧（比如 {"frame_count": n, "last_frame": 文件名}），
+        文件夹里多了帧时 checkpoint 就不再算数。
+        """
+        self.source = source
+        self.source_frames = source_frames
+        if not self.checkpoint or source is None or not os.path.exists(self.checkpoint):
+            return []
+
+        with open(self.checkpoint, "r") as f:
+            state = json.load(f)
+        if state["source"] != str(source) or state["params"] != self._params():
+            print(f"Checkpoint {self.checkpoint} does not match {source}, start from frame 0")
+            return []
+
+        self.next_index   = state["next_index"]
+        self.tree_index   = state["tree_index"]
+        self.track_frames = state["track_frames"]
+        self.y_centers[:] = state["y_centers"]
+        self.ratios[:]    = state["ratios"]
+        self.activetrack[:] = [tuple(x) for x in state["activetrack"]]
+        self.events = [dict(e, identity=tuple(e["identity"]) if e["identity"] else None)
+                       for e in state["events"]]
+        print(f"Resume {source} from frame {self.next_index} ({self.tree_index} trees so far)")
+        return [dict(e, track=None) for e in self.events]
+
+    def save_checkpoint(self):
+        """把当前状态写到 checkpoint 文件，先写临时文件再替换，避免写到一半被杀掉"""
+        if not self.checkpoint or self.source is None:
+            return
+        state = {
+            "source": str(self.source),
+            "params": self._params(),
+            "next_index": self.next_index,
+            "tree_index": self.tree_index,
+            "track_frames": self.track_frames,
+            "y_centers": self.y_centers,
+            "ratios": self.ratios,
+            "activetrack": self.activetrack,
+            "events": self.events,
+        }
+        tmp_path = self.checkpoint + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint)
+
+    def _count(self, frames, replay):
+        for event in replay:
+            yield event
+
+        for p, frame in frames:
+            event = self.update(p, frame)
+            self.next_index += 1
+            if event:
+                self._record(event)
+                yield event
+            if self.next_index % self.checkpoint_every == 0:
+                self.save_checkpoint()
+
+        event = self.finish()
+        if event:
+            self._record(event)
+            yield event
+        if self.keep_checkpoint:
+            self.save_checkpoint()  # 再跑一次时直接得到结果
+        elif self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)  # 跑完了，下次从头开始，不会重放过时的结果
+
+    def _record(self, event):
+        if self.checkpoint and self.source is not None:
+            self.events.append({k: v for k, v in event.items() if k != "track"})
+
+    def _params(self):
+        return dict(self.filter_params, y_gap=self.y_gap, model=self._model_id(), frames=self.source_frames)
+
+    def _model_id(self):
+        """权重文件的 hash 加 iou，和 DetectionCache 用的 key 一样；换了模型 checkpoint 就不算数"""
+        if self._model_key is None:
+            self._model_key = self.session.model_key
+            if self._model_key is None:
+                weights = self.session.weights
+                self._model_key = f"{file_hash(weights) if os.path.isfile(weights) else weights}:{self.session.iou}"
+        return self._model_key
+
+    def _event(self, finished_tree, frames):
+        self.tree_index += 1
+        print("Finished tree with", frames, "frames:")
         identity_file = find_identity(finished_tree)
         print("identity frame is:", identity_file)
-        save_result.append(identity_file)
-
-    print(save_result)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        return {
+            "tree": self.tree_index,
+            "frames": frames,
+            "track": finished_tree,
+            "identity": identity_file,
+        }
+
+    def _trim(self):
+        # 没有检测到的帧对 find_identity 没有用，不放进 active track
+        if self.activetrack and self.activetrack[-1][0] == []:
+            self.activetrack.pop()
+
+        # activetracking 只用到 y_centers[-1] 和之前最近的一个非空 y，其余的历史可以丢掉
+        if len(self.y_centers) > self.history:
+            tail = self.y_centers[-self.history:]
+            if not any(tail[:-1]):
+                last = next((yc for yc in reversed(self.y_centers[:-self.history]) if yc), None)
+                if last is not None:
+                    tail = [last] + tail
+            self.y_centers[:] = tail
+        del self.ratios[:-self.history]
+
+
+def bag_frames(bag_file, depth_cutoff: int = 5500, flip: bool = True):
+    """
+    从 .bag 里逐帧读出对齐后的 RGB（scripts/dataCollection/bag_ingest.read_bag），做和 RGB_filter.py + flip.py 一样的预处理
+    （深度为 0 或超过 depth_cutoff 毫米的像素置黑，再水平翻转），生成 (key, frame)。
+    """
+    from dataCollection.bag_ingest import read_bag  # 用到 pyrealsense2，只在读 .bag 时才 import
 
+    for index, _, rgb_image, depth_image in read_bag(bag_file, align=True):
+        rgb_image[(depth_image == 0) | (depth_image > depth_cutoff)] = 0
+        if flip:
+            rgb_image = cv2.flip(rgb_image, 1)
+        yield f"{bag_file}:{index:07d}", rgb_image
 
 
+def queue_frames(frame_queue, stop_event=None):
+    """
+    从相机消费者进程的队列里取 (key, frame)，收到 None 或 stop_event 被设置时结束。
+    """
+    while True:
+        try:
+            item = frame_queue.get(timeout=0.5)
+        except queue.Empty:
+            if stop_event is not None and stop_event.is_set():
+                break
+            continue
+        if item is None:
+            break
+        yield item
 
 
 
@@ -303,8 +463,28 @@ if __name__ == '__main__':
 
 
 
+if __name__ == '__main__':
 
+    # image_dir = "014/right/flipped_filtered_data_R14-55"
+    image_dir = "/Volumes/LaCie/Agrosense2/data_2025_7_22/data/250122075706/20250714_2046/flipped_filtered55"
+    # image_dir = "/Volumes/LaCie/Agrosense2/009/left/filtered_data_L009-55"
+    out_dir   = "detected_trunks"
+    os.makedirs(out_dir, exist_ok=True)
 
+    # 按数字 filename 排序后逐帧处理（count_directory 里完成）
+    # 预计算 y_centers 和 ratios。ycenter因该是从大到小的，因为树是从图片的下方移动到上方
 
+    y_gap = 0.3 # 越大表示可以容忍的没检测到树干的间隙越大
+    save_result = []
+    # 整个 run 只加载一次模型；检测结果存到 SQLite 缓存里，换 y_gap 等参数重跑时不用再跑 YOLO
+    session = DetectorSession(cache=DetectionCache("detection_cache.db"))
+    # 中途崩溃或被杀掉时，再跑一次会从 checkpoint 接着处理
+    counter = TreeCounter(session, y_gap=y_gap, checkpoint=os.path.join(out_dir, "tree_count_checkpoint.json"))
 
+    # 按顺序分批推理（batch 8~16 在 CPU 上效率高很多），下一批在后台解码；tracking 仍然逐帧按顺序进行
+    # 每结束一棵树就得到一个事件，包括最后一棵树
+    for event in counter.count_directory(image_dir):
+        print(event["track"])
+        save_result.append(event["identity"])
 
+    print(save_result)
@@ -1,56 +1,40 @@
-from ultralytics import YOLO
+from detector_session import DetectorSession, get_session
+from detection_cache import DetectionCache
 from pathlib import Path
 import os
 import glob
 import numpy as np
 import cv2
 import pandas as pd
+from roi_ratio import NonblackProfile
+from box_filter import same_row_keep
 
 
 def yolo_detection(image_path: str, weights: str = "train3/weights/best.pt",
                    project: str = "runs/detect", name: str = "predict5",
-                   iou: float = 0.1):
+                   iou: float = 0.1, session: DetectorSession = None):
 
-    model = YOLO(weights)
+    # 模型只加载一次：没有传入 session 时复用同参数的全局会话
+    if session is None:
+        session = get_session(weights, project, name, iou)
 
-    results = model(
-        image_path,
-        stream=True,
-        save=True,
-        save_txt=True,
-        save_conf=True,
-        iou=iou,
-        project=project,
-        name=name,
-        exist_ok=True
-    )
+    return session.label_path(image_path)
 
-    for _ in results:
-        break
 
-    # 构造标签文件的路径
-    img_stem = Path(image_path).stem
-    label_dir = Path(project) / name / "labels"
-    label_path = label_dir / f"{img_stem}.txt"
-
-    if not label_path.exists():  # 如果没有检测出物体，就不会自己生成txt文件，需要自己补齐一个
-        label_dir.mkdir(parents=True, exist_ok=True)  # 确保标签目录存在
-        label_path.write_text("")  # 创建空 txt 文件
-
-    return str(label_path)
-
-
-def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_threshold: float = 0.005):
+def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_threshold: float = 0.005,
+                      y_threshold: float = 0.15):
     """
     作用是去掉不相关的bounding box
-    读取并过滤一个 YOLO label 文件（每行：
+    读取并过滤一个 YOLO label 文件或 (N,6) 检测数组（每行：
       class x_center y_center width height [confidence]
     归一化到 0~1）。只保留符合“最左侧 + buffer + 最高置信度”规则的那一行。
     返回：保留的那一行（含 '\n'），或空列表（文件无内容）。
     """
-    # 读所有行
-
-    arr = np.loadtxt(label_path, ndmin=2)  # 确保返回 shape==(1,6) 或 (N,6)
+    # 读所有行。直接传入 (N,6) 数组时（DetectorSession.detect 的结果）就不用再读 txt 了
+    if isinstance(label_path, np.ndarray):
+        arr = label_path
+    else:
+        arr = np.loadtxt(label_path, ndmin=2)  # 确保返回 shape==(1,6) 或 (N,6)
 
     if arr.size == 0:
         return []
@@ -75,22 +59,7 @@ def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_thresho
     else:  # 如果还是有多个，就要保证同一水平线上（垂直于地面方向）只有一个bbx
         xc = candidates[:, 1]
         yc = candidates[:, 2]
-        y_threshold = 0.15
-        keep = np.ones(candidates.shape[0], dtype=bool)
-
-        for i in range(len(keep)):
-            if not keep[i]:
-                continue
-            for j in range(i+1, len(keep)):
-                if not keep[j]:
-                    continue
-                if abs(yc[i] - yc[j]) < y_threshold:
-                    # 同水平线，删掉 x 更大的 （更高的）
-                    if xc[i] < xc[j]:
-                        keep[j] = False
-                    else:
-                        keep[i] = False
-                        break
+        keep = same_row_keep(xc, yc, y_threshold)  # 同水平线，删掉 x 更大的 （更高的）
 
         candidates = candidates[keep]  # 肯定是大于等于1的
 
@@ -99,8 +68,8 @@ def filter_label_file(label_path: str, threshold_norm: float = 0.3, area_thresho
 
 
 def nonblack_ratio(image_path, x, y, w, h):   # y central 默认197
-    # 提取 图片中间部分的ROI
-    img = cv2.imread(image_path)
+    # 提取 图片中间部分的ROI。已经解码好的帧可以直接传进来
+    img = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
     roi = img[y:y+h, x:x+w]
 
     # 判断黑色像素
@@ -113,20 +82,22 @@ def nonblack_ratio(image_path, x, y, w, h):   # y central 默认197
 
 
 
-def ratio_select_filter(image_path: str, candidates, ratio_threds):
-    filtered_box = []
+def ratio_select_filter(image_path, candidates, ratio_threds, profile: NonblackProfile = None):
+    """
+    image_path 可以是文件路径，也可以是已经解码好的帧；
+    也可以直接传入这一帧的 NonblackProfile，所有候选框的 ROI 比例一次算完，不再重复读图。
+    """
     if len(candidates) == 0:
-        return np.array(filtered_box)
-    else:
-        for i in range(len(candidates)):
-            y = candidates[i, 2]
-            H = cv2.imread(image_path).shape[0]  # 图像高度
-            y_pixel = int(y * H)
-            nonblack_ratio_box = nonblack_ratio(image_path, x = 92, y = y_pixel, w = 177, h = 65)
-            # print("filtered nonblack ratio ", nonblack_ratio_box)
-            if nonblack_ratio_box > ratio_threds:
-                filtered_box.append(candidates[i])
-    return np.array(filtered_box)
+        return np.array([])
+
+    if profile is None:
+        frame = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
+        profile = NonblackProfile(frame, x = 92, w = 177)
+
+    y_pixels = (candidates[:, 2] * profile.height).astype(int)  # 图像高度
+    nonblack_ratio_box = profile.ratios(y_pixels, h = 65)
+    # print("filtered nonblack ratio ", nonblack_ratio_box)
+    return candidates[nonblack_ratio_box > ratio_threds]
 
 
 def get_central(list):
@@ -136,12 +107,23 @@ def get_central(list):
 
 
 
-def activetracking(p, y_centers, ratios, activetrack, y_gap):
+def activetracking(p, y_centers, ratios, activetrack, y_gap, session=None, frame=None, profile=None,
+                   threshold_norm=0.3, area_threshold=0.005, ratio_threds=0.2, y_threshold=0.15):
     new_tree_flag = False  # 默认不是新树
 
-    txt  = yolo_detection(p)
-    line = filter_label_file(txt)
-    filtered_line = ratio_select_filter(p, line, ratio_threds = 0.2)
+    # 每帧只解码一次，检测、候选框和中间 ROI 的非黑比例都用同一帧
+    # 参数扫描时会直接传入缓存好的 profile，这时连图都不用读
+    if frame is None and profile is None:
+        frame = cv2.imread(p)
+
+    if session is None:
+        session = get_session()
+    boxes = session.detect(p, frame)  # 直接用内存里的检测框，不再写 txt 再读回来
+    line = filter_label_file(boxes, threshold_norm, area_threshold, y_threshold)
+
+    if profile is None:
+        profile = NonblackProfile(frame, x = 92, w = 177)
+    filtered_line = ratio_select_filter(frame, line, ratio_threds = ratio_threds, profile = profile)
 
     # ===== 之前的filter还不够彻底，在这里再重新联系前后帧再筛选一遍 ============
     # 只有一个bbx，直接保存
@@ -174,7 +156,7 @@ def activetracking(p, y_centers, ratios, activetrack, y_gap):
         y_centers.append([])
 
     # 保存图像中间非黑像素比
-    ratios.append(nonblack_ratio(p, x = 92, y = 197, w = 177, h = 65))
+    ratios.append(profile.ratio(y = 197, h = 65))
 
 # ===================以下是tracking===============================
 
@@ -224,14 +206,15 @@ def find_identity(activetrack):
 
 
 
-def find_tree_coordinate(finished_tree):
+def find_tree_coordinate(finished_tree, session=None):
     cooridinate_list = []
     for tracks in finished_tree:
         filename = tracks[1]
         target_y = tracks[0]
 
-        txt = yolo_detection(filename)
-        arr = np.loadtxt(txt, ndmin=2)  # 确保返回 shape==(1,6) 或 (N,6)
+        if session is None:
+            session = get_session()
+        arr = session.detect(filename)  # activetracking 已经检测过，这里直接命中缓存
         arr_unique = np.unique(arr, axis=0)
 
         if target_y == []:
@@ -271,16 +254,19 @@ if __name__ == '__main__':
     ratios = []
     save_result = []
     activetrack = []
+    # 整个 run 只加载一次模型；检测结果存到 SQLite 缓存里，换 y_gap 等参数重跑时不用再跑 YOLO
+    session = DetectorSession(cache=DetectionCache("detection_cache.db"))
 
 
 
-    for p in paths:  # p 就是对应的文件名
+    # 按顺序分批推理（batch 8~16 在 CPU 上效率高很多），下一批在后台解码；tracking 仍然逐帧按顺序进行
+    for p, frame in session.prefetch(paths, batch_size=8):  # p 就是对应的文件名
 
-        finished_tree = activetracking(p, y_centers, ratios, activetrack, y_gap)
+        finished_tree = activetracking(p, y_centers, ratios, activetrack, y_gap, session, frame)
         if finished_tree:
             print("Finished tree with", len(finished_tree), "frames:")
             print(finished_tree)
-            cooridinates = find_tree_coordinate(finished_tree)
+            cooridinates = find_tree_coordinate(finished_tree, session)
             print("x,y are", cooridinates)  # 可以输出一整个树的序列所有的中心点
 
 
@@ -290,7 +276,7 @@ if __name__ == '__main__':
         finished_tree = activetrack.copy()
         activetrack.clear()
         print(finished_tree)
-        cooridinates = find_tree_coordinate(finished_tree)
+        cooridinates = find_tree_coordinate(finished_tree, session)
         print("x,y are", cooridinates)
 
 